@@ -1,5 +1,24 @@
-from . import crop_box_selector
+import importlib
+from . import crop_tools
+from . import image_formats
+from . import image_loader
+from . import instrumentation
+from . import job_runner
+from . import lookup_cache
 from . import mssql_query
+from . import ocr_backends
+from . import ocr_tools
+from . import page_index
 from . import pdf_image_config
-from . import pdf_image_viewer
-from . import pdf_sorter_gui
+from . import pdf_render
+from . import preprocess
+from . import stage_manifest
+
+# the tkinter modules are only imported when they are first used, so headless runs do not need a display
+_gui_modules = ('crop_box_selector', 'pdf_image_viewer', 'pdf_sorter_gui')
+
+
+def __getattr__(name):
+    if name in _gui_modules:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
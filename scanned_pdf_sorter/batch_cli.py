@@ -0,0 +1,161 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scanned_pdf_sorter.pdf_image_config import default_config_create
+from scanned_pdf_sorter.pdf_sorter_tools import SorterTools
+
+
+def find_pdf_files(inputs):
+    """Expands the given files, directories, and glob patterns into a sorted list of pdf files"""
+    pdf_files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, '*.pdf')) + glob.glob(os.path.join(item, '*.PDF'))
+        elif glob.has_magic(item):
+            matches = glob.glob(item, recursive=True)
+        else:
+            matches = [item]
+        for match in sorted(matches):
+            if os.path.isfile(match) and match.lower().endswith('.pdf'):
+                path = os.path.abspath(match)
+                if path not in pdf_files:
+                    pdf_files.append(path)
+    return pdf_files
+
+
+def output_dirs(pdf_files, output_root):
+    """Gives every pdf file its own output directory inside the output root, named after the file"""
+    dirs = {}
+    used = set()
+    for pdf_file in pdf_files:
+        name = os.path.splitext(os.path.basename(pdf_file))[0]
+        unique_name = name
+        count = 1
+        while unique_name in used:
+            count += 1
+            unique_name = f"{name}-{count}"
+        used.add(unique_name)
+        dirs[pdf_file] = os.path.join(output_root, unique_name)
+    return dirs
+
+
+def process_pdf(pdf_file, output_dir, config_file='config.ini', overrides=None, stream=False, database=False):
+    """Runs the whole sorting pipeline on one pdf file and returns a summary dict
+
+    The output of the run is written to a log file inside the output directory, instead of to the terminal
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {'file': pdf_file, 'output_dir': output_dir, 'status': 'failed', 'pages': 0, 'groups': 0,
+               'seconds': 0.0, 'error': None}
+    start_time = time.perf_counter()
+    with open(os.path.join(output_dir, 'sorter.log'), 'w') as log_file, contextlib.redirect_stdout(log_file):
+        try:
+            tools = SorterTools(config_file=config_file)
+            tools.config_overrides = dict(overrides or {})
+            tools.load_box_config()
+            tools.input_file = pdf_file
+            tools.output_dir = os.path.join(output_dir, 'pdf_sorter_out')
+            if database:
+                tools.connect_to_database()
+            if stream:
+                tools.run_stream()
+                result = {'pages': sum(len(group['pages']) for group in tools.output_dict.values()),
+                          'groups': len(tools.output_dict)}
+            else:
+                result = tools.run_batch()
+            if result is not None:
+                summary.update(result)
+                summary['status'] = 'ok'
+            summary['stages'] = tools.recorder.summary()
+        except Exception as e:
+            summary['error'] = f"{type(e).__name__}: {e}"
+            print(f"-Error: {summary['error']}")
+    summary['seconds'] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+def print_summary(summaries):
+    """Prints a table with the result of each processed pdf file"""
+    name_width = max([len(os.path.basename(summary['file'])) for summary in summaries] + [4])
+    print(f"{'file'.ljust(name_width)}  status  pages  groups  seconds")
+    for summary in summaries:
+        print(f"{os.path.basename(summary['file']).ljust(name_width)}  {summary['status'].ljust(6)}  "
+              f"{summary['pages']:>5}  {summary['groups']:>6}  {summary['seconds']:>7.1f}")
+        if summary['error']:
+            print(f"    {summary['error']}")
+    failed = len([summary for summary in summaries if summary['status'] != 'ok'])
+    print(f"-{len(summaries) - failed} files sorted, {failed} files failed")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pdf_sorter_batch',
+                                     description='Sorts the pages of many scanned pdf files without a display')
+    parser.add_argument('inputs', nargs='+', help='pdf files, directories of pdf files, or glob patterns')
+    parser.add_argument('-o', '--output', default='pdf_sorter_batch',
+                        help='directory that holds one output directory per pdf file')
+    parser.add_argument('-c', '--config', default='config.ini', help='config file to use')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='number of pdf files processed at once (0 uses one per cpu core)')
+    parser.add_argument('--ocr-workers', type=int, default=0,
+                        help='tesseract processes per pdf file (0 splits the cpu cores between the jobs)')
+    parser.add_argument('--stream', action='store_true', help='use the in-memory stream pipeline')
+    parser.add_argument('--database', action='store_true', help='look up the customer emails in the database')
+    return parser
+
+
+def main(argv=None):
+    multiprocessing.freeze_support()
+    args = build_parser().parse_args(argv)
+
+    pdf_files = find_pdf_files(args.inputs)
+    if len(pdf_files) == 0:
+        print('-No pdf files found')
+        return 1
+    default_config_create(args.config)
+    output_root = os.path.abspath(args.output)
+    dirs = output_dirs(pdf_files, output_root)
+
+    cpu_count = os.cpu_count() or 1
+    jobs = min(args.jobs if args.jobs > 0 else cpu_count, len(pdf_files))
+    # the cores are split between the jobs, so the pools inside each job do not oversubscribe them
+    job_workers = max(cpu_count // jobs, 1)
+    ocr_workers = args.ocr_workers if args.ocr_workers > 0 else job_workers
+    overrides = {('SETTINGS', 'ocr_workers'): ocr_workers, ('SETTINGS', 'crop_workers'): job_workers,
+                 ('SETTINGS', 'render_workers'): job_workers}
+    print(f"-Sorting {len(pdf_files)} pdf files with {jobs} jobs, {ocr_workers} OCR workers and {job_workers} "
+          f"crop and render workers per job")
+
+    summaries = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(process_pdf, pdf_file, dirs[pdf_file], os.path.abspath(args.config), overrides,
+                                   args.stream, args.database): pdf_file for pdf_file in pdf_files}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                # the job's process died, such as from running out of memory, which also breaks the pool
+                summary = {'file': futures[future], 'output_dir': dirs[futures[future]], 'status': 'failed',
+                           'pages': 0, 'groups': 0, 'seconds': 0.0, 'error': f"{type(e).__name__}: {e}"}
+            print(f"-{os.path.basename(summary['file'])}: {summary['status']} ({summary['seconds']:.1f}s)")
+            summaries.append(summary)
+    summaries.sort(key=lambda summary: pdf_files.index(summary['file']))
+
+    print_summary(summaries)
+    report = {'seconds': round(time.perf_counter() - start_time, 3), 'jobs': jobs, 'ocr_workers': ocr_workers,
+              'job_workers': job_workers, 'files': summaries}
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, 'batch_summary.json'), 'w') as json_file:
+        json.dump(report, json_file, indent=4)
+    print(f"-{os.path.join(output_root, 'batch_summary.json')} created")
+    return 0 if all(summary['status'] == 'ok' for summary in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
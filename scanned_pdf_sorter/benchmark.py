@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import contextlib
+import configparser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+from scanned_pdf_sorter.pdf_image_config import default_config_create
+from scanned_pdf_sorter.pdf_sorter_tools import SorterTools
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# where the synthetic id numbers are printed, in pixels at the benchmark dpi
+BENCH_CROP_BOX = (100, 100, 700, 250)
+BENCH_PAGE_SIZE = (8.5, 11)
+
+
+def page_ids(page_count, seed=0):
+    """Returns the id number of each page, where every id covers a run of one to four pages"""
+    rng = random.Random(seed)
+    ids = []
+    while len(ids) < page_count:
+        customer_id = str(rng.randint(1000, 99999))
+        ids.extend([customer_id] * rng.randint(1, 4))
+    return ids[:page_count]
+
+
+def make_synthetic_pdf(pdf_path, page_count, dpi=200, seed=0, chunk_size=25):
+    """Creates a scanned looking pdf file with a known id number printed inside the crop box of every page
+
+    The pages are written a chunk at a time, so that large page counts do not have to be held in memory.
+    Returns the list of the id numbers that were printed, in page order
+    """
+    ids = page_ids(page_count, seed)
+    size = (int(BENCH_PAGE_SIZE[0] * dpi), int(BENCH_PAGE_SIZE[1] * dpi))
+    try:
+        font = ImageFont.load_default(size=int((BENCH_CROP_BOX[3] - BENCH_CROP_BOX[1]) * 0.6))
+    except TypeError:
+        font = ImageFont.load_default()
+    rng = random.Random(seed)
+
+    for start in range(0, page_count, chunk_size):
+        pages = []
+        for num in range(start, min(start + chunk_size, page_count)):
+            page = Image.new('L', size, 255)
+            draw = ImageDraw.Draw(page)
+            draw.text((BENCH_CROP_BOX[0] + 20, BENCH_CROP_BOX[1] + 20), ids[num], fill=0, font=font)
+            for line in range(400, size[1] - 200, 60):
+                draw.line((150, line, rng.randint(size[0] // 2, size[0] - 150), line), fill=90, width=4)
+            pages.append(page.convert('1'))
+        pages[0].save(pdf_path, resolution=dpi, save_all=True, append_images=pages[1:], append=start > 0)
+    return ids
+
+
+def folder_size(folder):
+    total = 0
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def peak_rss():
+    """Returns the peak resident memory in bytes of this process and of its finished child processes"""
+    if resource is None:
+        return {'self': None, 'children': None}
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+def time_stage(results, name, tools, output_dir, page_count, function, *args):
+    """Runs one stage as a stage of the tools' recorder, keeping its time, the bytes that this process wrote, which
+    leaves out the images that pdftoppm writes, and how much the output folder grew"""
+    disk_before = folder_size(output_dir)
+    with tools.recorder.stage(f"bench_{name}") as record:
+        value = function(*args)
+    results[name] = {'seconds': round(record['wall'], 4),
+                     'pages_per_sec': round(page_count / record['wall'], 2) if record['wall'] > 0 else None,
+                     'write_bytes': record.get('write_bytes'),
+                     'disk_bytes_added': max(folder_size(output_dir) - disk_before, 0)}
+    return value
+
+
+def output_name(page_count, image_type=None):
+    if image_type is None:
+        return f"out-{page_count}"
+    return f"out-{page_count}-{image_type}"
+
+
+def run_benchmark(page_count, work_dir, dpi=200, overrides=None, seed=0, image_type=None):
+    """Times each stage of SorterTools on a synthetic pdf file and returns the results as a dict
+
+    When an image_type is given, the page images and crops are saved in that format instead of the configured one
+    """
+    overrides = dict(overrides or {})
+    if image_type is not None:
+        overrides[('SETTINGS', 'image_type')] = image_type
+    os.makedirs(work_dir, exist_ok=True)
+    pdf_path = os.path.join(work_dir, f"synthetic-{page_count}.pdf")
+    if os.path.isfile(pdf_path) is False:
+        print(f"-Creating a {page_count} page synthetic pdf")
+        make_synthetic_pdf(pdf_path, page_count, dpi=dpi, seed=seed)
+    expected = page_ids(page_count, seed)
+
+    config_file = os.path.join(work_dir, 'bench_config.ini')
+    default_config_create(config_file)
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    config.set('SETTINGS', 'dpi', str(dpi))
+    for option, value in zip(('start_x', 'start_y', 'end_x', 'end_y'), BENCH_CROP_BOX):
+        config.set('CROP_BOX', option, str(value))
+    with open(config_file, 'w') as file:
+        config.write(file)
+
+    output_dir = os.path.join(work_dir, output_name(page_count, image_type))
+    stages = {}
+    print(f"-Benchmarking {page_count} pages" + (f" saved as {image_type}" if image_type else ""))
+    log_name = f"bench-{output_name(page_count, image_type)[len('out-'):]}.log"
+    with open(os.path.join(work_dir, log_name), 'w') as log_file, contextlib.redirect_stdout(log_file):
+        tools = SorterTools(config_file=config_file)
+        tools.config_overrides = overrides
+        tools.load_box_config()
+        tools.input_file = pdf_path
+        tools.output_dir = output_dir
+        tools.output_clean()
+        tools.create_output_dir()
+
+        start_time = time.perf_counter()
+        time_stage(stages, 'pdf_image_splitter', tools, output_dir, page_count, tools.pdf_image_splitter, pdf_path)
+        time_stage(stages, 'run_cropping', tools, output_dir, page_count, tools.run_cropping)
+        time_stage(stages, 'run_ocr', tools, output_dir, page_count, tools.run_ocr)
+        pdf_dict = time_stage(stages, 'get_pdf_dict', tools, output_dir, page_count, tools.get_pdf_dict)
+        time_stage(stages, 'run_merge', tools, output_dir, page_count, tools.run_merge, pdf_dict)
+        total_seconds = time.perf_counter() - start_time
+        image_type = tools.image_type()
+
+    page_texts = {}
+    for key, group in pdf_dict.items():
+        for page_num in group['pages']:
+            page_texts[page_num] = key
+    correct = len([num for num, page_id in enumerate(expected, start=1) if page_texts.get(num) == page_id])
+
+    return {'pages': page_count, 'dpi': dpi, 'image_type': image_type,
+            'overrides': {f"{section}.{option}": value for (section, option), value in overrides.items()},
+            'total_seconds': round(total_seconds, 4),
+            'pages_per_sec': round(page_count / total_seconds, 2) if total_seconds > 0 else None,
+            'accuracy': round(correct / page_count, 4), 'groups': len(pdf_dict),
+            'expected_groups': len(set(expected)), 'output_bytes': folder_size(output_dir),
+            'image_bytes': sum(folder_size(os.path.join(output_dir, folder)) for folder in ('images', 'crops')),
+            'peak_rss': peak_rss(), 'stages': stages}
+
+
+def run_benchmark_process(*args, **kwargs):
+    """Runs run_benchmark in a new process and returns its results
+
+    ru_maxrss never goes down while a process runs, so each run gets a process of its own to report its own peak
+    memory instead of the highest peak of the runs before it
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run_benchmark, *args, **kwargs).result()
+
+
+def print_results(results):
+    print(f"{'pages':>6}  {'stage':<20}  {'seconds':>9}  {'pages/s':>8}  {'disk MB':>8}  {'write MB':>8}")
+    for result in results:
+        for name, stage in result['stages'].items():
+            write_mb = f"{stage['write_bytes'] / 1e6:>8.1f}" if stage['write_bytes'] is not None else f"{'-':>8}"
+            print(f"{result['pages']:>6}  {name:<20}  {stage['seconds']:>9.2f}  {stage['pages_per_sec'] or 0:>8.1f}  "
+                  f"{stage['disk_bytes_added'] / 1e6:>8.1f}  {write_mb}")
+        print(f"{result['pages']:>6}  {'total':<20}  {result['total_seconds']:>9.2f}  "
+              f"{result['pages_per_sec'] or 0:>8.1f}  {result['output_bytes'] / 1e6:>8.1f}"
+              f"  (accuracy {result['accuracy']:.1%})")
+        if result['peak_rss']['self'] is not None:
+            print(f"{result['pages']:>6}  peak memory {result['peak_rss']['self'] / 1e6:.0f} MB, "
+                  f"child processes {result['peak_rss']['children'] / 1e6:.0f} MB")
+
+
+def print_format_comparison(results):
+    """Prints the time of the stages that read or write image files next to the disk space of the images, for each
+    image_type that was benchmarked"""
+    print(f"{'pages':>6}  {'image_type':<10}  {'split s':>8}  {'crop s':>8}  {'ocr s':>8}  {'total s':>8}  "
+          f"{'image MB':>8}  {'accuracy':>8}")
+    for result in results:
+        stages = result['stages']
+        print(f"{result['pages']:>6}  {result['image_type']:<10}  {stages['pdf_image_splitter']['seconds']:>8.2f}  "
+              f"{stages['run_cropping']['seconds']:>8.2f}  {stages['run_ocr']['seconds']:>8.2f}  "
+              f"{result['total_seconds']:>8.2f}  {result['image_bytes'] / 1e6:>8.1f}  {result['accuracy']:>8.1%}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pdf_sorter_bench',
+                                     description='Times each stage of the pdf sorter on synthetic scanned pdf files')
+    parser.add_argument('--pages', type=int, nargs='+', default=[50, 500, 5000], help='page counts to benchmark')
+    parser.add_argument('--dpi', type=int, default=200, help='dpi of the synthetic pdf files and of the render')
+    parser.add_argument('-o', '--output', default='pdf_sorter_bench', help='folder for the benchmark files')
+    parser.add_argument('--json', default=None, help='file to save the results to (default: OUTPUT/results.json)')
+    parser.add_argument('--set', action='append', default=[], metavar='OPTION=VALUE',
+                        help='overrides a SETTINGS option of the config, for example --set ocr_workers=4')
+    parser.add_argument('--image-types', nargs='+', default=None, metavar='IMAGE_TYPE',
+                        help='image_type values to compare, for example --image-types png ppm jpeg tiff')
+    parser.add_argument('--keep', action='store_true', help='keep the output folders of each run')
+    return parser
+
+
+def main(argv=None):
+    multiprocessing.freeze_support()
+    args = build_parser().parse_args(argv)
+    overrides = {}
+    for item in args.set:
+        option, value = item.split('=', 1)
+        overrides[('SETTINGS', option.strip())] = value.strip()
+
+    work_dir = os.path.abspath(args.output)
+    results = []
+    for page_count in args.pages:
+        for image_type in args.image_types or [None]:
+            results.append(run_benchmark_process(page_count, work_dir, dpi=args.dpi, overrides=overrides,
+                                                 image_type=image_type))
+            if args.keep is False:
+                shutil.rmtree(os.path.join(work_dir, output_name(page_count, image_type)), ignore_errors=True)
+
+    print_results(results)
+    if args.image_types:
+        print_format_comparison(results)
+    json_file_name = args.json or os.path.join(work_dir, 'results.json')
+    with open(json_file_name, 'w') as json_file:
+        json.dump({'python': sys.version.split()[0], 'platform': sys.platform, 'cpu_count': os.cpu_count(),
+                   'results': results}, json_file, indent=4)
+    print(f"-{json_file_name} created")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,14 @@
 import os
 import math
 import tkinter as tk
-from PIL import ImageTk, Image
+from PIL import ImageTk
+from scanned_pdf_sorter import page_index
+from scanned_pdf_sorter import image_formats
+from scanned_pdf_sorter.image_loader import ImageLoader, ThumbnailCache
 
 
 class PdfCropSelector:
-    def __init__(self, image_dir, size_divisor=1, box_coords=None):
+    def __init__(self, image_dir, size_divisor=1, box_coords=None, thumbnail_dir=None):
         self.window = tk.Toplevel()
         self.window.title("Bounding Box Selector")
         self.window.resizable(True, True)
@@ -18,37 +21,40 @@ class PdfCropSelector:
         self.start_y = 0
         self.end_x = 0
         self.end_y = 0
+        self.loader = None
+        self.photo = None
         try:
-            for file in os.listdir(self.image_dir):
-                if file.endswith(".jpg") | file.endswith(".png"):
-                    index_num = int(file.split('-')[-1].split('.')[0])
-                    self.image_dict[index_num] = dict()
-                    input_image = Image.open(os.path.join(self.image_dir, file))
-                    input_image = input_image.resize((math.floor(input_image.size[0] / self.size_divisor),
-                                                      math.floor(input_image.size[1] / self.size_divisor)))
-                    input_image = input_image.crop((0, 0, input_image.size[0],
-                                                    math.floor(input_image.size[1] / self.size_divisor)))
-                    self.image_dict[index_num]['image'] = (ImageTk.PhotoImage(input_image))
-                    del index_num
+            if os.path.isdir(self.image_dir) is False:
+                raise FileNotFoundError(self.image_dir)
+            for index_num, file in page_index.page_files(self.image_dir).items():
+                if image_formats.is_image(file):
+                    self.image_dict[index_num] = {'image_file': os.path.join(self.image_dir, file)}
         except FileNotFoundError:
             self.window.destroy()
+        self.loader = ImageLoader({num: image['image_file'] for num, image in self.image_dict.items()},
+                                  size_divisor=self.size_divisor,
+                                  thumbnail_cache=ThumbnailCache(thumbnail_dir) if thumbnail_dir else None)
 
-        self.create_canvas(index=1)
-        self.status_label = tk.Label(self.window, text="Image 1 of {}".format(len(self.image_dict)), bd=1,
-                                     relief="sunken", anchor="w")
+        self.page_numbers = list(self.image_dict)
+        self.position = 0
 
-        self.back_btn = tk.Button(self.window, text="<<", command=self.back, state="disabled")
-        self.quit_btn = tk.Button(self.window, text="Save Box Coordinates", command=lambda: self.deactivate())
-        self.forward_btn = tk.Button(self.window, text=">>", command=lambda: self.forward(2))
+        # the widgets are made once, turning a page only changes the image of the canvas
+        self.image_canvas = tk.Canvas(self.window, cursor='cross')
+        self.canvas_image = self.image_canvas.create_image(0, 0, anchor='nw')
+        self.status_label = tk.Label(self.window, bd=1, relief="sunken", anchor="w")
+        self.back_btn = tk.Button(self.window, text="<<", command=self.back)
+        self.quit_btn = tk.Button(self.window, text="Save Box Coordinates", command=self.deactivate)
+        self.forward_btn = tk.Button(self.window, text=">>", command=self.forward)
 
+        self.image_canvas.grid(row=0, column=0, columnspan=3)
         self.back_btn.grid(row=2, column=0)
         self.quit_btn.grid(row=2, column=1, pady=10)
         self.forward_btn.grid(row=2, column=2)
         self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
 
-        self.window.bind('<Left>', lambda event: [self.back, self.left_btn()])
-        self.window.bind('<Right>', lambda event, n=2: [self.forward(n), self.right_btn()])
-        self.window.bind('<Escape>', lambda event: [self.deactivate()])
+        self.window.bind('<Left>', lambda event: self.back())
+        self.window.bind('<Right>', lambda event: self.forward())
+        self.window.bind('<Escape>', lambda event: self.deactivate())
         self.image_canvas.bind("<ButtonPress-1>", self.on_button_press)
         self.image_canvas.bind("<B1-Motion>", self.on_move_press)
         self.image_canvas.bind("<ButtonRelease-1>", self.on_button_release)
@@ -64,15 +70,34 @@ class PdfCropSelector:
                                                            self.end_x, self.end_y,
                                                            outline='red')
 
-    def create_canvas(self, index):
-        try:
-            self.image_canvas.grid_forget()
-        except Exception:
-            pass
-        image = self.image_dict[index]['image']
-        self.image_canvas = tk.Canvas(self.window, cursor='cross', height=image.height(), width=image.width())
-        self.image_canvas.create_image((image.width() / 2, image.height() / 2), image=image)
-        self.image_canvas.grid(row=0, column=0, columnspan=3)
+        self.show_page(0)
+
+    def show_page(self, position):
+        """Shows the page at a position of the page list on the existing canvas, keeping the selected box"""
+        if position < 0 or position >= len(self.page_numbers):
+            return
+        self.position = position
+        image = self.page_image(self.page_numbers[position])
+        self.image_canvas.configure(height=image.height(), width=image.width())
+        self.image_canvas.itemconfigure(self.canvas_image, image=image)
+        if self.rect:
+            self.image_canvas.tag_raise(self.rect)
+        self.status_label.configure(text="Image {} of {}".format(position + 1, len(self.page_numbers)))
+        self.back_btn.configure(state="disabled" if position == 0 else "normal")
+        self.forward_btn.configure(state="disabled" if position == len(self.page_numbers) - 1 else "normal")
+
+    def forward(self):
+        self.show_page(self.position + 1)
+
+    def back(self):
+        self.show_page(self.position - 1)
+
+    def page_image(self, index):
+        """Returns the PhotoImage of the top part of a page, which is kept until the next page is shown"""
+        thumbnail = self.loader.get(index)
+        thumbnail = thumbnail.crop((0, 0, thumbnail.size[0], math.floor(thumbnail.size[1] / self.size_divisor)))
+        self.photo = ImageTk.PhotoImage(thumbnail)
+        return self.photo
 
     def on_button_press(self, event):
         # print("[+] Mouse click")
@@ -106,78 +131,11 @@ class PdfCropSelector:
         self.start_y = math.floor(self.start_y * self.size_divisor)
         self.end_x = math.floor(self.end_x * self.size_divisor)
         self.end_y = math.floor(self.end_y * self.size_divisor)
+        if self.loader is not None:
+            self.loader.close()
         self.window.destroy()
         self.window.quit()
 
-    def forward(self, image_number):
-
-        if image_number in self.image_dict:
-            # self.image_canvas.grid_forget()
-            # self.image_canvas = tk.Label(self.window)
-            # self.image_canvas.create_image(image=self.image_dict[image_number]['image'])
-            self.create_canvas(index=image_number)
-            self.forward_btn = tk.Button(self.window, text=">>", command=lambda: self.forward(image_number + 1))
-            self.back_btn = tk.Button(self.window, text="<<", command=lambda: self.back(image_number - 1))
-
-            self.window.bind('<Left>', lambda event, n=image_number - 1: [self.forward(n), self.left_btn()])
-            self.window.bind('<Right>', lambda event, n=image_number + 1: [self.back(n), self.right_btn()])
-            self.image_canvas.bind("<ButtonPress-1>", self.on_button_press)
-            self.image_canvas.bind("<B1-Motion>", self.on_move_press)
-            self.image_canvas.bind("<ButtonRelease-1>", self.on_button_release)
-
-            try:
-                self.image_canvas.create_rectangle(self.start_x, self.start_y, self.end_x, self.end_y, outline='red')
-            except Exception:
-                pass
-            self.status_label = tk.Label(self.window, text="Image {} of {}".format(image_number, len(self.image_dict)),
-                                         bd=1, relief="sunken", anchor="w")
-
-            if image_number == len(self.image_dict):
-                self.forward_btn = tk.Button(self.window, text=">>", state="disabled")
-                self.window.bind('<Right>', lambda event: self.right_btn)
-
-            self.back_btn.grid(row=2, column=0)
-            self.forward_btn.grid(row=2, column=2)
-            self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
-
-    def back(self, image_number):
-
-        if image_number in self.image_dict:
-            # self.image_canvas.grid_forget()
-            # self.image_canvas = tk.Label(self.window)
-            # self.image_canvas.create_image(image=self.image_dict[image_number]['image'])
-            self.create_canvas(index=image_number)
-            self.forward_btn = tk.Button(self.window, text=">>", command=lambda: self.forward(image_number + 1))
-            self.back_btn = tk.Button(self.window, text="<<", command=lambda: self.back(image_number - 1))
-
-            self.window.bind('<Left>', lambda event, n=image_number - 1: [self.forward(n), self.left_btn()])
-            self.window.bind('<Right>', lambda event, n=image_number + 1: [self.back(n), self.right_btn()])
-            self.image_canvas.bind("<ButtonPress-1>", self.on_button_press)
-            self.image_canvas.bind("<B1-Motion>", self.on_move_press)
-            self.image_canvas.bind("<ButtonRelease-1>", self.on_button_release)
-
-            try:
-                self.image_canvas.create_rectangle(self.start_x, self.start_y, self.end_x, self.end_y, outline='red')
-            except Exception:
-                pass
-
-            self.status_label = tk.Label(self.window, text="Image {} of {}".format(image_number, len(self.image_dict)),
-                                         bd=1, relief="sunken", anchor="w")
-
-            if image_number == 1:
-                self.back_btn = tk.Button(self.window, text="<<", state="disabled")
-                self.window.bind('<Left>', lambda event: self.left_btn())
-
-            self.back_btn.grid(row=2, column=0)
-            self.forward_btn.grid(row=2, column=2)
-            self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
-
-    def left_btn(self):
-        print('', end='')
-
-    def right_btn(self):
-        print('', end='')
-
 
 if __name__ == '__main__':
     viewer = PdfCropSelector('pdf_sorter_out/images', size_divisor=3)
@@ -0,0 +1,95 @@
+import time
+import PIL
+from PIL import Image
+from scanned_pdf_sorter.image_formats import save_image
+
+# bits per pixel of the uncompressed pixel layouts whose rows can be read straight out of the file
+_raw_bits = {'1': 1, 'L': 8, 'P': 8, 'RGB': 24, 'BGR': 24}
+
+# the major Pillow versions that the partial decode was checked against with tests/test_crop_tools.py, it rewrites
+# the private Image._size and the ImageFile._Tile entries of an opened image, which Pillow is free to change, so any
+# other version decodes whole images
+_pillow_partial_decode_versions = (11, 12)
+
+
+def _row_stride(rawmode, width):
+    return (width * _raw_bits[rawmode] + 7) // 8
+
+
+def pillow_partial_decode():
+    """Returns True if the installed Pillow is one that the partial decode of _decode_rows was checked against"""
+    return int(PIL.__version__.split('.')[0]) in _pillow_partial_decode_versions
+
+
+def _set_decoded_rows(image, height, extents, offset):
+    """Shrinks an opened, not yet loaded image to the given rows by rewriting Pillow internals
+
+    Only called when pillow_partial_decode() allows it
+    """
+    image._size = (image.size[0], height)
+    image.tile = [image.tile[0]._replace(extents=extents, offset=offset)]
+
+
+def _decode_rows(image, box):
+    """Limits the decoding of an opened image to the rows of the box, where the file format allows it
+
+    Uncompressed files (binary ppm/pgm, bmp, and uncompressed tiff) seek straight to the first row of the box, while
+    non-interlaced png files stop decoding after the last row of the box, as the rows below it are never needed.
+    Returns the box moved to the coordinates of the decoded rows, or None if the whole image has to be decoded,
+    which includes boxes that reach past the top or bottom of the image, as Image.crop fills those rows in.
+    """
+    if pillow_partial_decode() is False or len(image.tile) != 1:
+        return None
+    codec_name, extents, offset, args = image.tile[0][:4]
+    width, height = image.size
+    left, upper, right, lower = box
+    if extents != (0, 0, width, height) or upper < 0 or lower > height or upper >= lower:
+        return None
+
+    if codec_name == 'raw':
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if rawmode not in _raw_bits or orientation != 1:
+            return None
+        stride = stride or _row_stride(rawmode, width)
+        _set_decoded_rows(image, lower - upper, (0, 0, width, lower - upper), offset + upper * stride)
+        return left, 0, right, lower - upper
+
+    if codec_name == 'zip' and image.format == 'PNG' and not image.info.get('interlace'):
+        _set_decoded_rows(image, lower, (0, 0, width, lower), offset)
+        return left, upper, right, lower
+    return None
+
+
+def open_region(image_file, box):
+    """Returns the (left, upper, right, lower) box of an image file, decoding as little of the file as its format allows
+
+    Jpeg files can not be partly decoded, but color jpeg files are decoded straight to grayscale with Image.draft,
+    which skips the color conversion while keeping the full resolution that the OCR scan needs
+    """
+    with Image.open(image_file) as image:
+        if image.format == 'JPEG' and image.mode != 'L':
+            image.draft('L', image.size)
+        try:
+            decoded_box = _decode_rows(image, box)
+        except (AttributeError, TypeError, ValueError):
+            decoded_box = None
+        if decoded_box is None:
+            return image.crop(box)
+        try:
+            image.load()
+        except OSError:
+            # the shortened decode was refused, so the file is decoded again in full
+            with Image.open(image_file) as full_image:
+                return full_image.crop(box)
+        return image.crop(decoded_box)
+
+
+def crop_file(image_file, box, output_file, image_type='png'):
+    """Crops an image file to the box and saves the crop in the format of image_type, returns the seconds that it
+    took"""
+    start_time = time.perf_counter()
+    crop = open_region(image_file, box)
+    save_image(crop, output_file, image_type)
+    return time.perf_counter() - start_time
@@ -0,0 +1,51 @@
+from PIL import Image
+
+# the values of the image_type setting: the pdftoppm options that render pages in the format, the extension that
+# pdftoppm gives the files, the image modes that crops are saved in as they are (any other mode is converted to the
+# first one), and the options that PIL saves crops with
+formats = {
+    'png': {'pdftoppm': ['-png'], 'extension': '.png', 'modes': ('RGB', '1', 'L', 'RGBA', 'P'),
+            'save': {'format': 'PNG', 'compress_level': 1}},
+    'ppm': {'pdftoppm': [], 'extension': '.ppm', 'modes': ('RGB', '1', 'L'), 'save': {'format': 'PPM'}},
+    'pgm': {'pdftoppm': ['-gray'], 'extension': '.pgm', 'modes': ('L', '1'), 'save': {'format': 'PPM'}},
+    'jpeg': {'pdftoppm': ['-jpeg', '-jpegopt', 'quality=90'], 'extension': '.jpg', 'modes': ('RGB', 'L'),
+             'save': {'format': 'JPEG', 'quality': 90}},
+    'tiff': {'pdftoppm': ['-tiff', '-gray', '-tiffcompression', 'lzw'], 'extension': '.tif', 'modes': ('L', '1'),
+             'save': {'format': 'TIFF', 'compression': 'tiff_lzw'}},
+    'tiff_mono': {'pdftoppm': ['-tiff', '-mono', '-tiffcompression', 'packbits'], 'extension': '.tif',
+                  'modes': ('1',), 'save': {'format': 'TIFF', 'compression': 'packbits'}},
+}
+formats['jpg'] = formats['jpeg']
+
+# the extensions of every file type that the page images and crops can be saved as
+extensions = ('.png', '.ppm', '.pgm', '.pbm', '.jpg', '.jpeg', '.tif', '.tiff')
+
+
+def is_image_type(image_type):
+    return image_type.strip().lower() in formats
+
+
+def get_format(image_type):
+    """Returns the format of an image_type value, or the png format if the value is unknown, which is_image_type
+    checks for when the config file is loaded"""
+    return formats.get(image_type.strip().lower(), formats['png'])
+
+
+def extension(image_type):
+    return get_format(image_type)['extension']
+
+
+def is_image(file_name):
+    return file_name.lower().endswith(extensions)
+
+
+def save_image(image, output_file, image_type='png'):
+    """Saves an image in the format of an image_type value, converting it to the mode of the format first"""
+    image_format = get_format(image_type)
+    mode = image_format['modes'][0]
+    if image.mode not in image_format['modes'] and mode == '1':
+        # the text of a scan is kept sharp by a plain threshold, dithering would turn gray into noise
+        image = image.convert('L').convert('1', dither=Image.Dither.NONE)
+    elif image.mode not in image_format['modes']:
+        image = image.convert(mode)
+    image.save(output_file, **image_format['save'])
@@ -0,0 +1,148 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from PIL import Image
+from scanned_pdf_sorter.stage_manifest import file_hash
+
+
+def load_thumbnail(image_file, size_divisor=1):
+    """Opens an image file and shrinks it by the size divisor"""
+    with Image.open(image_file) as image:
+        image.load()
+        if image.mode == '1':
+            # shrinking a 1-bit scan in gray keeps its thin lines visible
+            image = image.convert('L')
+        return image.resize((math.floor(image.size[0] / size_divisor), math.floor(image.size[1] / size_divisor)))
+
+
+class ThumbnailCache:
+    """Saves the shrunken display images of the viewers into a folder, so they are only decoded and resized once
+
+    Thumbnails are keyed by the hash of the source image and the size divisor, a page whose image is rendered again
+    with the same contents keeps its thumbnail, and a changed page gets a new one
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, image_file, size_divisor):
+        return os.path.join(self.cache_dir, f"{file_hash(image_file)}-{size_divisor}.png")
+
+    def get(self, image_file, size_divisor=1):
+        """Returns the thumbnail of an image file, creating and saving it when it is not in the cache yet"""
+        thumbnail_file = self.path(image_file, size_divisor)
+        try:
+            with Image.open(thumbnail_file) as thumbnail:
+                thumbnail.load()
+                return thumbnail
+        except (OSError, SyntaxError):
+            pass
+        thumbnail = load_thumbnail(image_file, size_divisor)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # saved under a temporary name first, so another thread or process never opens half of a thumbnail
+        temp_file = f"{thumbnail_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+        thumbnail.save(temp_file, format='PNG')
+        os.replace(temp_file, thumbnail_file)
+        return thumbnail
+
+    def generate(self, image_files, size_divisors):
+        """Creates the thumbnails of every image file for every size divisor ahead of time"""
+        for image_file in image_files:
+            for size_divisor in size_divisors:
+                try:
+                    self.get(image_file, size_divisor)
+                except OSError as error:
+                    print(f"-Unable to create a thumbnail of {image_file}: {error}")
+
+
+class ImageLoader:
+    """Loads the display images of a viewer on demand
+
+    Only the page that is shown and a window of the pages around it are decoded, the window by a background thread,
+    and only the most recently used thumbnails are kept. Opening a viewer then takes the same time and memory no
+    matter how many pages there are. With a ThumbnailCache the thumbnails are also kept on disk between sessions.
+    Thumbnails are PIL images, the PhotoImage has to be made on the tkinter thread.
+    """
+
+    def __init__(self, image_files, size_divisor=1, prefetch=2, cache_size=16, thumbnail_cache=None):
+        self.image_files = dict(image_files)
+        self.page_numbers = list(self.image_files)
+        self.page_positions = {num: position for position, num in enumerate(self.page_numbers)}
+        self.size_divisor = size_divisor
+        self.thumbnail_cache = thumbnail_cache
+        self.prefetch = max(prefetch, 0)
+        self.cache_size = max(cache_size, self.prefetch * 2 + 1)
+        self.thumbnails = OrderedDict()
+        self.wanted = []
+        self.stopped = False
+        self.lock = threading.Condition()
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def __contains__(self, num):
+        return num in self.image_files
+
+    def get(self, num):
+        """Returns the thumbnail of a page, decoding it right away if it is not ready, and prefetches its neighbours"""
+        with self.lock:
+            thumbnail = self.thumbnails.get(num)
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(num)
+        if thumbnail is None:
+            thumbnail = self.load(num)
+            self.store(num, thumbnail)
+        self.prefetch_around(num)
+        return thumbnail
+
+    def load(self, num):
+        if self.thumbnail_cache is not None:
+            return self.thumbnail_cache.get(self.image_files[num], self.size_divisor)
+        return load_thumbnail(self.image_files[num], self.size_divisor)
+
+    def prefetch_around(self, num):
+        """Queues the pages next to a page for the background thread, the nearest pages first"""
+        position = self.page_positions[num]
+        window = []
+        for offset in range(1, self.prefetch + 1):
+            for neighbour in (position + offset, position - offset):
+                if 0 <= neighbour < len(self.page_numbers):
+                    window.append(self.page_numbers[neighbour])
+        with self.lock:
+            self.wanted = [neighbour for neighbour in window if neighbour not in self.thumbnails]
+            self.lock.notify()
+
+    def store(self, num, thumbnail):
+        with self.lock:
+            self.thumbnails[num] = thumbnail
+            self.thumbnails.move_to_end(num)
+            while len(self.thumbnails) > self.cache_size:
+                self.thumbnails.popitem(last=False)
+
+    def worker(self):
+        while True:
+            with self.lock:
+                while not self.wanted and not self.stopped:
+                    self.lock.wait()
+                if self.stopped:
+                    return
+                num = self.wanted.pop(0)
+                if num in self.thumbnails:
+                    continue
+            try:
+                thumbnail = self.load(num)
+            except OSError as error:
+                print(f"-Unable to load {self.image_files[num]}: {error}")
+                continue
+            self.store(num, thumbnail)
+
+    def close(self):
+        """Stops the background thread and drops the kept thumbnails"""
+        with self.lock:
+            self.stopped = True
+            self.wanted = []
+            self.thumbnails.clear()
+            self.lock.notify()
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import cProfile
+import functools
+from contextlib import contextmanager
+
+
+def io_counters():
+    """Returns the (bytes read, bytes written) of this process, or (None, None) where they are not available"""
+    try:
+        with open('/proc/self/io') as io_file:
+            counters = dict(line.split(':') for line in io_file.read().splitlines() if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def child_cpu_time():
+    """Returns the cpu time used by the finished child processes, such as tesseract and pdftoppm"""
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class RunRecorder:
+    """Records how long each stage of a run takes, for the whole stage and for each page
+
+    Every record holds the wall time, the cpu time of this process and of its child processes, and the bytes read and
+    written. Records are passed to the listeners as they are made, and are saved as json lines by finish(). Stages
+    named in profile_stages are also run under cProfile, with the stats saved into profile_dir.
+    """
+
+    def __init__(self, log_file=None, profile_stages=(), profile_dir=None):
+        self.log_file = log_file
+        self.profile_stages = set(profile_stages)
+        self.profile_dir = profile_dir
+        self.records = []
+        self.listeners = []
+        self.started_at = time.time()
+
+    def add_listener(self, listener):
+        """Adds a function that is called with every new record"""
+        self.listeners.append(listener)
+
+    def add(self, record):
+        self.records.append(record)
+        for listener in self.listeners:
+            listener(record)
+
+    @contextmanager
+    def stage(self, name, page=None):
+        """Times the code inside the with block as one stage, or one page of a stage
+
+        The record is given to the with block, so extra values such as the tesseract time can be added to it
+        """
+        record = {'stage': name, 'page': page, 'start': time.time()}
+        profiler = None
+        if page is None and name in self.profile_stages:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        child_start = child_cpu_time()
+        read_start, write_start = io_counters()
+        try:
+            yield record
+        finally:
+            record['wall'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu'] = round(time.process_time() - cpu_start, 6)
+            record['child_cpu'] = round(child_cpu_time() - child_start, 6)
+            read_end, write_end = io_counters()
+            if read_start is not None and read_end is not None:
+                record['read_bytes'] = read_end - read_start
+                record['write_bytes'] = write_end - write_start
+            if profiler is not None:
+                profiler.disable()
+                if self.profile_dir:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    profiler.dump_stats(os.path.join(self.profile_dir, f"profile-{name}.prof"))
+            self.add(record)
+
+    def summary(self):
+        """Returns a dict of stage name to the totals of all of the records of that stage"""
+        totals = {}
+        for record in self.records:
+            stage = totals.setdefault(record['stage'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'child_cpu': 0.0,
+                                                        'read_bytes': 0, 'write_bytes': 0,
+                                                        'tesseract_seconds': 0.0})
+            stage['count'] += 1
+            for key in ('wall', 'cpu', 'child_cpu', 'read_bytes', 'write_bytes', 'tesseract_seconds'):
+                stage[key] += record.get(key) or 0
+        return totals
+
+    def print_summary(self):
+        print(f"{'stage':<14}{'count':>7}{'wall s':>10}{'cpu s':>9}{'child s':>9}{'ocr s':>9}{'read MB':>9}"
+              f"{'write MB':>10}")
+        for name, stage in self.summary().items():
+            print(f"{name:<14}{stage['count']:>7}{stage['wall']:>10.2f}{stage['cpu']:>9.2f}{stage['child_cpu']:>9.2f}"
+                  f"{stage['tesseract_seconds']:>9.2f}{stage['read_bytes'] / 1e6:>9.1f}"
+                  f"{stage['write_bytes'] / 1e6:>10.1f}")
+
+    def finish(self):
+        """Saves every record as one json line into the log file"""
+        if self.log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_file)), exist_ok=True)
+            with open(self.log_file, 'w') as log_file:
+                for record in self.records:
+                    log_file.write(json.dumps(record) + '\n')
+
+
+def recorded_stage(name):
+    """Decorates a SorterTools method so that each call of it is recorded as a stage by the tools' recorder"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with self.recorder.stage(name):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,94 @@
+import time
+import queue
+import threading
+import traceback
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class JobRunner:
+    """Runs the stages of a SorterTools object in a background thread
+
+    The job never touches a widget, it reports what it is doing as messages in a thread safe queue that the tk thread
+    reads with poll(). Jobs are cancelled cooperatively, the next progress report of a cancelled job raises
+    JobCancelled, so a stage always stops between two pages.
+    """
+
+    def __init__(self, tools):
+        self.tools = tools
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.stage_started = {}
+        tools.progress_listeners.append(self.progress)
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, name, steps, then=None):
+        """Runs the steps one after another in a background thread
+
+        then is called by the tk thread once every step has finished, it is not called when the job is cancelled or
+        fails. Returns False if another job is still running.
+        """
+        if self.running():
+            print(f"-Unable to start {name}, another job is still running")
+            return False
+        self.cancel_event.clear()
+        self.stage_started = {}
+        self.thread = threading.Thread(target=self.run, args=(name, steps, then), daemon=True)
+        self.thread.start()
+        return True
+
+    def run(self, name, steps, then):
+        self.messages.put({'type': 'started', 'job': name})
+        try:
+            for step in steps:
+                self.check_cancelled()
+                step()
+        except JobCancelled:
+            print(f"-{name} cancelled")
+            self.messages.put({'type': 'cancelled', 'job': name})
+        except Exception as error:
+            traceback.print_exc()
+            self.messages.put({'type': 'failed', 'job': name, 'error': str(error)})
+        else:
+            self.messages.put({'type': 'finished', 'job': name, 'then': then})
+        finally:
+            self.cancel_event.clear()
+
+    def cancel(self):
+        """Asks the running job to stop at its next progress report"""
+        if self.running():
+            print("-Cancelling, the job stops after the current page")
+            self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set() and threading.current_thread() is self.thread:
+            raise JobCancelled()
+
+    def progress(self, stage, done, total):
+        """Progress listener of the tools, puts a progress message with the estimated seconds left into the queue"""
+        now = time.perf_counter()
+        started_at, started_done = self.stage_started.setdefault(stage, (now, done))
+        eta = None
+        if total and done > started_done:
+            eta = (now - started_at) / (done - started_done) * (total - done)
+        self.messages.put({'type': 'progress', 'stage': stage, 'done': done, 'total': total, 'eta': eta})
+        self.check_cancelled()
+
+    def poll(self):
+        """Returns the messages that were put into the queue since the last poll"""
+        messages = []
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                return messages
+            if message['type'] in ('finished', 'cancelled', 'failed'):
+                # the thread only has its finally block left, so a job started by the message's then callback is not
+                # refused as another job that is still running
+                self.thread.join()
+            messages.append(message)
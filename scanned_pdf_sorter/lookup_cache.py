@@ -0,0 +1,98 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class LookupCache:
+    """Least recently used cache for customer number to email lookups
+
+    Entries expire after ttl seconds, and when a db_file is given the entries are also kept in a local sqlite file so
+    that they survive restarts. Expired entries are kept until they are replaced, so they can still be used when the
+    database can not be reached.
+    """
+
+    def __init__(self, max_size=1024, ttl=86400, db_file=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if db_file:
+            self.db = sqlite3.connect(db_file, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS lookup_cache "
+                            "(key TEXT PRIMARY KEY, value TEXT, stored_at REAL)")
+            self.db.commit()
+
+    def _read(self, key):
+        """Returns the (value, stored_at) entry of a key from memory or from the sqlite file"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.db is not None:
+            row = self.db.execute("SELECT value, stored_at FROM lookup_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                return row[0], row[1]
+        return None
+
+    def _remember(self, key, value, stored_at):
+        self.entries[key] = (value, stored_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        """Returns a (found, value) pair for the key, counting the lookup as a hit or a miss"""
+        key = str(key)
+        with self.lock:
+            entry = self._read(key)
+            if entry is not None and (time.time() - entry[1] < self.ttl):
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def get_stale(self, key):
+        """Returns a (found, value) pair for the key even if the entry has expired, used when the database fails"""
+        key = str(key)
+        with self.lock:
+            entry = self._read(key)
+            if entry is None:
+                return False, None
+            self.stale_hits += 1
+            return True, entry[0]
+
+    def set(self, key, value):
+        """Stores a looked up value, values of None are not cached so that new customers are found later on"""
+        if value is None:
+            return
+        key = str(key)
+        stored_at = time.time()
+        with self.lock:
+            self._remember(key, value, stored_at)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO lookup_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                                (key, value, stored_at))
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM lookup_cache")
+                self.db.commit()
+
+    def stats(self):
+        """Returns the hit and miss counters of the cache"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'size': len(self.entries)}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -3,6 +3,8 @@ import configparser
 
 
 class MsSqlQuery:
+    # SQL Server allows at most 2100 parameters in one statement
+    max_parameters = 2000
 
     def __init__(self, config_file='config.ini'):
         self.config = configparser.ConfigParser()
@@ -38,18 +40,66 @@ class MsSqlQuery:
     def test_connection(self):
         pass
 
+    @staticmethod
+    def quote_name(name):
+        """Quotes a table or column name from the config file so it can be placed inside a query"""
+        return '[' + str(name).replace(']', ']]') + ']'
+
+    def get_cursor(self):
+        """Returns the cursor that is reused for every query on the current connection
+
+        Reusing one cursor lets the driver keep the last prepared statement, so repeated queries with the same
+        statement text are not prepared again
+        """
+        if self.cursor is None:
+            self.cursor = self.conn.cursor()
+        return self.cursor
+
     def database_query(self, customer_num):
-        with self.conn.cursor() as curs:
-            curs.execute(f"""
-                SELECT {self.query_column}
-                FROM {self.table_name}
-                where {self.filter_column} = {str(customer_num)};
-            """)
-            results = curs.fetchone()
+        curs = self.get_cursor()
+        curs.execute(f"""
+            SELECT {self.quote_name(self.query_column)}
+            FROM {self.quote_name(self.table_name)}
+            where {self.quote_name(self.filter_column)} = ?;
+        """, int(customer_num))
+        results = curs.fetchone()
+        if results is None:
+            return None
         return results[0]
 
+    def database_query_many(self, customer_nums):
+        """Looks up the emails of many customer numbers and returns a dict of customer number to email
+
+        The numbers are sent as parameters of one IN (...) query per chunk of max_parameters numbers, each chunk is
+        padded to a power of two length so that only a handful of different statements ever get prepared
+        """
+        results = {num: None for num in customer_nums}
+        ids = {}
+        for num in customer_nums:
+            if str(num).isdigit():
+                ids.setdefault(int(num), []).append(num)
+        id_list = sorted(ids)
+        curs = self.get_cursor()
+        for start in range(0, len(id_list), self.max_parameters):
+            chunk = id_list[start:start + self.max_parameters]
+            size = 1
+            while size < len(chunk):
+                size *= 2
+            size = min(size, self.max_parameters)
+            chunk = chunk + [chunk[-1]] * (size - len(chunk))
+            curs.execute(f"""
+                SELECT {self.quote_name(self.filter_column)}, {self.quote_name(self.query_column)}
+                FROM {self.quote_name(self.table_name)}
+                where {self.quote_name(self.filter_column)} IN ({', '.join('?' * size)});
+            """, *chunk)
+            for row in curs.fetchall():
+                for num in ids.get(int(row[0]), []):
+                    results[num] = row[1]
+        return results
+
 
 if __name__ == '__main__':
     database = MsSqlQuery(config_file='config.ini')
     database.build_connection(trusted=False)
     print(database.database_query(1175))
+    print(database.database_query_many([1175, 1176]))
@@ -0,0 +1,201 @@
+import os
+import csv
+import shlex
+import tempfile
+import subprocess
+import pytesseract
+from PIL import Image
+from scanned_pdf_sorter.pdf_render import startupinfo
+
+# backend instances of this process, kept so that each engine only loads its traineddata once
+_backends = {}
+
+
+def parse_config(config):
+    """Splits tesseract command line options into the page segmentation mode and a dict of -c variables"""
+    args = shlex.split(config)
+    psm = None
+    variables = {}
+    for option, value in zip(args, args[1:] + ['']):
+        if option == '--psm':
+            psm = int(value)
+        elif option == '-c' and '=' in value:
+            name, variable = value.split('=', 1)
+            variables[name] = variable
+    return psm, variables
+
+
+def parse_tsv(output):
+    """Returns a dict of page number to the (block, paragraph, line, text, confidence) words of tesseract tsv output"""
+    pages = {}
+    for row in csv.DictReader(output.splitlines(), delimiter='\t', quoting=csv.QUOTE_NONE):
+        if row.get('level') != '5' or not (row.get('text') or '').strip():
+            continue
+        line = (int(row['block_num']), int(row['par_num']), int(row['line_num']))
+        pages.setdefault(int(row['page_num']), []).append(line + (row['text'], float(row['conf'])))
+    return pages
+
+
+def words_to_data(words):
+    """Joins the tsv words of one page back into text, with one line of text per line that tesseract found
+
+    Returns the text along with a list of the (word, confidence) pairs of the page
+    """
+    lines = {}
+    for block_num, par_num, line_num, text, conf in words:
+        lines.setdefault((block_num, par_num, line_num), []).append(text)
+    text = '\n'.join(' '.join(line) for line in lines.values())
+    return text, [(word[3], word[4]) for word in words]
+
+
+class PytesseractBackend:
+    """Runs one tesseract process per image through pytesseract, the backend that always works
+
+    Every backend returns the text of an image along with the (word, confidence) pairs of the words tesseract read,
+    where confidences go from 0 to 100
+    """
+
+    name = 'pytesseract'
+    # backends that scan many images with one tesseract process are given a batch of crops at a time
+    batches = False
+
+    def __init__(self, lang='eng', config=''):
+        self.lang = lang
+        self.config = config
+
+    def image_to_data(self, image):
+        output = pytesseract.image_to_data(image, lang=self.lang, config=self.config)
+        return words_to_data(parse_tsv(output).get(1, []))
+
+    def images_to_data(self, images):
+        return [self.image_to_data(image) for image in images]
+
+    def files_to_data(self, input_files):
+        """Scans image files as they are, the backends that can read files themselves skip opening them here"""
+        images = []
+        for input_file in input_files:
+            with Image.open(input_file) as image:
+                image.load()
+                images.append(image)
+        return self.images_to_data(images)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend(PytesseractBackend):
+    """Keeps one tesseract engine loaded through the tesserocr bindings, so no process is started per image"""
+
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', config=''):
+        super().__init__(lang, config)
+        import tesserocr
+        psm, variables = parse_config(config)
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+        if psm is not None:
+            self.api.SetPageSegMode(psm)
+        for name, value in variables.items():
+            self.api.SetVariable(name, value)
+
+    def image_to_data(self, image):
+        self.api.SetImage(image)
+        text = self.api.GetUTF8Text()
+        return text, [(word, float(conf)) for word, conf in self.api.MapWordConfidences()]
+
+    def close(self):
+        self.api.End()
+
+
+class BatchBackend(PytesseractBackend):
+    """Scans many images with one tesseract process that reads a list of image files
+
+    The tsv output numbers the images of the list in its page_num column, which maps every word back to its image no
+    matter how many images had no text at all
+    """
+
+    name = 'batch'
+    batches = True
+
+    def images_to_data(self, images):
+        if len(images) == 0:
+            return []
+        with tempfile.TemporaryDirectory(prefix='pdf_sorter_ocr_') as temp_dir:
+            image_files = []
+            for num, image in enumerate(images):
+                image_file = os.path.join(temp_dir, f"{num}.png")
+                image.save(image_file)
+                image_files.append(image_file)
+            list_file = os.path.join(temp_dir, 'images.txt')
+            with open(list_file, 'w') as file:
+                file.write('\n'.join(image_files) + '\n')
+            return self.scan_tsv(list_file, len(images))
+
+    def files_to_data(self, input_files):
+        """Lists the image files as they are, so files that are already on disk are not encoded again"""
+        if len(input_files) == 0:
+            return []
+        with tempfile.TemporaryDirectory(prefix='pdf_sorter_ocr_') as temp_dir:
+            list_file = os.path.join(temp_dir, 'images.txt')
+            with open(list_file, 'w') as file:
+                file.write('\n'.join(os.path.abspath(input_file) for input_file in input_files) + '\n')
+            return self.scan_tsv(list_file, len(input_files))
+
+    def scan_tsv(self, input_file, image_count):
+        """Runs one tesseract process with tsv output on a file that holds image_count images"""
+        command = ([pytesseract.pytesseract.tesseract_cmd, input_file, 'stdout', '-l', self.lang]
+                   + shlex.split(self.config) + ['tsv'])
+        output = subprocess.run(command, capture_output=True, check=True,
+                                startupinfo=startupinfo()).stdout.decode('utf-8')
+        pages = parse_tsv(output)
+        return [words_to_data(pages.get(page_num, [])) for page_num in range(1, image_count + 1)]
+
+
+class TiffBatchBackend(BatchBackend):
+    """Stacks many images into the frames of one multi-page tiff and scans it with one tesseract run, which saves
+    writing and opening one file per image"""
+
+    name = 'tiff'
+    # the files are stacked into one tiff, which needs them opened
+    files_to_data = PytesseractBackend.files_to_data
+
+    def images_to_data(self, images):
+        if len(images) == 0:
+            return []
+        # converted copies, an image that was saved before keeps the encoder settings of that save
+        frames = [image.convert('1' if image.mode == '1' else 'L') for image in images]
+        with tempfile.TemporaryDirectory(prefix='pdf_sorter_ocr_') as temp_dir:
+            tiff_file = os.path.join(temp_dir, 'crops.tif')
+            frames[0].save(tiff_file, save_all=True, append_images=frames[1:])
+            return self.scan_tsv(tiff_file, len(images))
+
+
+backends = {backend.name: backend for backend in (PytesseractBackend, TesserocrBackend, BatchBackend,
+                                                  TiffBatchBackend)}
+
+
+def batches(name):
+    """Returns True if the named backend scans a batch of crops with each tesseract process"""
+    return name in backends and backends[name].batches
+
+
+def get_backend(name='pytesseract', lang='eng', config=''):
+    """Returns the backend of this process for the given settings, creating it on first use
+
+    Falls back to pytesseract if the backend is unknown or its engine can not be loaded
+    """
+    key = (name, lang, config)
+    if key not in _backends:
+        try:
+            _backends[key] = backends[name](lang, config)
+        except (KeyError, ImportError, RuntimeError) as error:
+            print(f"-Unable to load the {name} OCR backend ({error!r}), using pytesseract")
+            _backends[key] = PytesseractBackend(lang, config)
+    return _backends[key]
+
+
+def close_backends():
+    """Closes the backends of this process, which unloads the engines that they keep loaded"""
+    for backend in _backends.values():
+        backend.close()
+    _backends.clear()
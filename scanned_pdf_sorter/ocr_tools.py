@@ -0,0 +1,146 @@
+import os
+import re
+import time
+import functools
+from multiprocessing import util
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import pytesseract
+from scanned_pdf_sorter.crop_tools import open_region
+from scanned_pdf_sorter.preprocess import preprocess
+from scanned_pdf_sorter.ocr_backends import get_backend, close_backends
+
+# tesseract options for a crop that holds one line of digits
+digits_config = '--psm 7 -c tessedit_char_whitelist=0123456789'
+
+# the extracted number of one OCR scan, the seconds spent in tesseract, the confidence of the number from 0 to 100,
+# and the (word, confidence) pairs of every word that tesseract read
+OcrResult = namedtuple('OcrResult', ['text', 'seconds', 'confidence', 'words'])
+
+
+def replace_chars(text):
+    """Removes every character that is not a digit from the given text"""
+    list_of_numbers = re.findall(r'\d+', text)
+    result_number = ''.join(list_of_numbers)
+    return result_number
+
+
+def number_text(text_data):
+    """Returns the number in the text of an OCR scan, or '0' if no number was found"""
+    text = replace_chars(text_data)
+    if text.isdigit() is False:
+        text = '0'
+    return text
+
+
+def number_confidence(words):
+    """Returns the mean confidence of the words that hold digits, or 0 if tesseract read no digits at all"""
+    confidences = [conf for word, conf in words if replace_chars(word) and conf >= 0]
+    if len(confidences) == 0:
+        return 0.0
+    return sum(confidences) / len(confidences)
+
+
+def extract_text_timed(image, lang='eng', config='', preprocess_steps=(), target_height=32, backend='pytesseract'):
+    """Runs an OCR scan on an image and returns its OcrResult, with the number and the seconds spent in tesseract
+
+    The image is first run through the given preprocessing steps, config holds extra tesseract options, and backend
+    names the ocr_backends engine that runs the scan
+    """
+    return extract_texts_timed([image], lang, config, preprocess_steps, target_height, backend)[0]
+
+
+def extract_texts_timed(images, lang='eng', config='', preprocess_steps=(), target_height=32, backend='pytesseract'):
+    """Runs OCR scans on many images at once, which the batch backends do with one tesseract process
+
+    Returns an OcrResult for each image, where the seconds spent in tesseract are shared evenly
+    """
+    if preprocess_steps:
+        images = [preprocess(image, preprocess_steps, target_height) for image in images]
+    engine = get_backend(backend, lang, config)
+    return timed_results(lambda: engine.images_to_data(images), len(images))
+
+
+def timed_results(scan, count):
+    """Runs a scan of count images and returns an OcrResult for each image, sharing the seconds evenly"""
+    start_time = time.perf_counter()
+    scans = scan()
+    tesseract_seconds = (time.perf_counter() - start_time) / max(count, 1)
+    return [OcrResult(number_text(text_data), tesseract_seconds, number_confidence(words), words)
+            for text_data, words in scans]
+
+
+def extract_files_text_timed(input_files, box=None, lang='eng', config='', preprocess_steps=(), target_height=32,
+                             backend='pytesseract'):
+    """Runs OCR scans on a batch of image files, or on the box of each file when a box is given
+
+    Without a box or preprocessing the files are handed to the backend as they are, so a batch backend reads them
+    straight from disk
+    """
+    input_files = list(input_files)
+    if box is None and not preprocess_steps:
+        engine = get_backend(backend, lang, config)
+        return timed_results(lambda: engine.files_to_data(input_files), len(input_files))
+    images = []
+    for input_file in input_files:
+        if box is None:
+            with Image.open(input_file) as image:
+                image.load()
+                images.append(image)
+        else:
+            images.append(open_region(input_file, box))
+    return extract_texts_timed(images, lang, config, preprocess_steps, target_height, backend)
+
+
+def init_worker(tesseract_cmd):
+    """Points the tesseract command of a worker process at the same executable as the parent process, and closes the
+    worker's backends when the pool shuts it down"""
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    util.Finalize(None, close_backends, exitpriority=10)
+
+
+def worker_count(value):
+    """Converts a configured worker count into a usable one, where 0 or less means one worker per cpu core"""
+    if value <= 0:
+        return os.cpu_count() or 1
+    return value
+
+
+def ordered_map(executor, fn, jobs, max_in_flight):
+    """Submits (tag, args) jobs to the executor and yields (tag, result) pairs in submission order
+
+    No more than max_in_flight jobs are submitted at once, so the memory used by pending work stays bounded
+    no matter how many jobs are given
+    """
+    pending = deque()
+    for tag, args in jobs:
+        if len(pending) >= max_in_flight:
+            done_tag, future = pending.popleft()
+            yield done_tag, future.result()
+        pending.append((tag, executor.submit(fn, *args)))
+    while pending:
+        done_tag, future = pending.popleft()
+        yield done_tag, future.result()
+
+
+def ocr_pool(workers):
+    """Creates a process pool whose workers are set up to run tesseract"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               initargs=(pytesseract.pytesseract.tesseract_cmd,))
+
+
+def ocr_files(input_files, workers, box=None, batch_size=1, **settings):
+    """Runs OCR scans over the given image files in parallel, or over the box of each file when a box is given
+
+    Each worker process is given batch_size files at a time. The settings are passed on to extract_texts_timed.
+    Yields (file, OcrResult) pairs in the given order
+    """
+    input_files = list(input_files)
+    batch_size = max(batch_size, 1)
+    batches = [input_files[start:start + batch_size] for start in range(0, len(input_files), batch_size)]
+    with ocr_pool(workers) as executor:
+        jobs = ((batch, (batch, box)) for batch in batches)
+        scanned = ordered_map(executor, functools.partial(extract_files_text_timed, **settings), jobs, workers * 2)
+        for batch, results in scanned:
+            yield from zip(batch, results)
@@ -0,0 +1,38 @@
+import os
+import re
+
+# the page number is the last run of digits in a file name, such as 'c0ffee-0012.png', '0012.png', or '0012.txt'
+_page_number_pattern = re.compile(r'(\d+)\D*$')
+
+
+def page_label(file_name):
+    """Returns the page number of an image, crop, or text file as it is written in the name, with its zero padding"""
+    match = _page_number_pattern.search(os.path.splitext(os.path.basename(file_name))[0])
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def page_number(file_name):
+    """Returns the page number of an image, crop, or text file as an int, or None if the name has no number"""
+    label = page_label(file_name)
+    if label is None:
+        return None
+    return int(label)
+
+
+def page_name(page_num, page_count):
+    """Returns the zero padded name of a page, padded to the number of digits of the page count like pdftoppm does"""
+    return str(page_num).zfill(len(str(page_count)))
+
+
+def page_files(folder):
+    """Returns a dict of page number to file name for the files of a folder, in page order"""
+    files = {}
+    if os.path.isdir(folder):
+        for file in os.listdir(folder):
+            num = page_number(file)
+            if num is not None:
+                files[num] = file
+    return dict(sorted(files.items()))
+
@@ -13,6 +13,33 @@ def default_config_create(filename='config.ini'):
         config.set('SETTINGS', 'dpi', '200')
         config.set('SETTINGS', 'image_type', 'png')
         config.set('SETTINGS', 'file_initial_search_dir', "''")
+        config.set('SETTINGS', 'stream_chunk_size', '8')
+        config.set('SETTINGS', 'render_workers', '4')
+        config.set('SETTINGS', 'render_chunk_size', '50')
+        config.set('SETTINGS', 'debug_files', 'no')
+        config.set('SETTINGS', 'ocr_workers', '0')
+        config.set('SETTINGS', 'crop_workers', '0')
+        config.set('SETTINGS', 'crop_to_ocr', 'no')
+        config.set('SETTINGS', 'ocr_preprocess', "")
+        config.set('SETTINGS', 'ocr_target_height', '32')
+        config.set('SETTINGS', 'ocr_digits_only', 'no')
+        config.set('SETTINGS', 'ocr_backend', 'pytesseract')
+        config.set('SETTINGS', 'ocr_batch_size', '32')
+        config.set('SETTINGS', 'ocr_confidence_threshold', '60')
+        config.set('SETTINGS', 'ocr_rescan_dpi', '0')
+        config.set('SETTINGS', 'crop_first_render', 'no')
+        config.set('SETTINGS', 'merge_engine', 'passthrough')
+        config.set('SETTINGS', 'incremental', 'no')
+        config.set('SETTINGS', 'profile_stages', "")
+        config.set('SETTINGS', 'lookup_cache_size', '1024')
+        config.set('SETTINGS', 'lookup_cache_ttl', '86400')
+        config.set('SETTINGS', 'lookup_cache_file', "")
+        config.set('SETTINGS', 'viewer_prefetch', '2')
+        config.set('SETTINGS', 'viewer_cache_size', '16')
+        config.set('SETTINGS', 'thumbnail_cache', 'yes')
+        config.set('SETTINGS', 'pregenerate_thumbnails', 'no')
+        config.set('SETTINGS', 'log_flush_interval', '100')
+        config.set('SETTINGS', 'log_max_lines', '5000')
         config.add_section('CROP_BOX')
         config.set('CROP_BOX', 'start_x', '0')
         config.set('CROP_BOX', 'start_y', '0')
@@ -1,11 +1,15 @@
 import os
-import math
+import json
 import tkinter as tk
-from PIL import ImageTk, Image
+from PIL import ImageTk
+from scanned_pdf_sorter import page_index
+from scanned_pdf_sorter import image_formats
+from scanned_pdf_sorter.image_loader import ImageLoader, ThumbnailCache
 
 
 class PdfImageViewer:
-    def __init__(self, image_dir='', size_divisor=2, only_images_boolean=False):
+    def __init__(self, image_dir='', size_divisor=2, only_images_boolean=False, prefetch=2, cache_size=16,
+                 thumbnail_dir=None, confidence_threshold=None):
         self.window = tk.Toplevel()
         self.window.title("Image Viewer")
         self.window.resizable(True, True)
@@ -13,95 +17,106 @@ class PdfImageViewer:
 
         self.image_dir = image_dir
         self.data_dict = {}
+        self.loader = None
+        self.photo = None
+        # page number to the confidence of its OCR scan, read from the confidence.json of the output folder
+        self.confidence = {}
 
         if os.path.isdir(self.image_dir):
             if self.only_images is False:
-                for file in os.listdir(os.path.join(self.image_dir, 'images')):
-                    if file.endswith(".jpg") | file.endswith(".png"):
-                        index_num = int(file.split('-')[-1].split('.')[0])
-                        self.data_dict[index_num] = {}
-                        input_image = Image.open(os.path.join(self.image_dir + '/images', file))
-                        # input_image = input_image.resize(
-                        #     (math.floor(input_image.size[0] / 3), math.floor(input_image.size[1] / 3)))
-                        input_image = input_image.resize(
-                            (math.floor(input_image.size[0] / size_divisor),
-                             math.floor(input_image.size[1] / size_divisor)))
-                        self.data_dict[index_num]['image'] = (ImageTk.PhotoImage(input_image))
-                        # print(os.path.join(image_dir, file))
-
-                for file in os.listdir(os.path.join(self.image_dir, 'text')):
-                    if file.endswith(".txt"):
-                        index_num = int(file.split('_')[-1].split('.')[0])
+                for index_num, file in page_index.page_files(os.path.join(self.image_dir, 'images')).items():
+                    if image_formats.is_image(file):
+                        self.data_dict[index_num] = {'text': '',
+                                                     'image_file': os.path.join(self.image_dir, 'images', file)}
+
+                for index_num, file in page_index.page_files(os.path.join(self.image_dir, 'text')).items():
+                    if file.endswith(".txt") and index_num in self.data_dict:
                         txt_file = open(os.path.join(self.image_dir + '/text', file), 'r')
                         self.data_dict[index_num]['text'] = txt_file.read()
+                        self.data_dict[index_num]['text_file'] = file
                         # print(txt_file.read())
                         txt_file.close()
 
+                confidence_file = os.path.join(self.image_dir, 'confidence.json')
+                if os.path.isfile(confidence_file):
+                    with open(confidence_file) as json_file:
+                        self.confidence = {int(num): record['confidence']
+                                           for num, record in json.load(json_file).items()}
+
                 def num_check(char):
                     return char.isdigit()
 
                 validation = self.window.register(num_check)
                 self.image_text = tk.Entry(self.window, justify='center',
                                            validate="key", validatecommand=(validation, '%S'))
-                self.image_text.insert(0, self.data_dict[1]['text'])
                 self.image_text.grid(row=1, column=0, columnspan=3)
             else:
-                for file in os.listdir(self.image_dir):
-                    if file.endswith(".jpg") | file.endswith(".png"):
-                        index_num = int(file.split('-')[-1].split('.')[0])
-                        self.data_dict[index_num] = {}
-                        input_image = Image.open(os.path.join(self.image_dir, file))
-                        # input_image = input_image.resize(
-                        #     (math.floor(input_image.size[0] / 3), math.floor(input_image.size[1] / 3)))
-                        input_image = input_image.resize((math.floor(input_image.size[0] / size_divisor),
-                                                          math.floor(input_image.size[1] / size_divisor)))
-                        self.data_dict[index_num]['image'] = (ImageTk.PhotoImage(input_image))
-                        # print(os.path.join(image_dir, file))
+                for index_num, file in page_index.page_files(self.image_dir).items():
+                    if image_formats.is_image(file):
+                        self.data_dict[index_num] = {'image_file': os.path.join(self.image_dir, file)}
         else:
             self.deactivate()
             exit('No valid directory provided')
 
-        self.status_label = tk.Label(self.window, text="Image 1 of {}".format(len(self.data_dict)), bd=1,
-                                     relief="sunken", anchor="w")
-
-        # print(self.image_dict[1]['image'])
-        self.image_label = tk.Label(self.window, image=self.data_dict[1]['image'])
+        # the page images are decoded on demand, a few pages ahead of the one that is shown
+        self.loader = ImageLoader({num: page['image_file'] for num, page in self.data_dict.items()},
+                                  size_divisor=size_divisor, prefetch=prefetch, cache_size=cache_size,
+                                  thumbnail_cache=ThumbnailCache(thumbnail_dir) if thumbnail_dir else None)
+
+        self.page_numbers = list(self.data_dict)
+        self.position = 0
+        # positions of the pages whose OCR scan is below the confidence threshold, the pages that need a review
+        self.suspects = []
+        if confidence_threshold is not None:
+            self.suspects = [position for position, num in enumerate(self.page_numbers)
+                             if num in self.confidence and self.confidence[num] < confidence_threshold]
+
+        # the widgets are made once, turning a page only changes what they show
+        self.image_label = tk.Label(self.window)
+        self.back_btn = tk.Button(self.window, text="<<", command=self.back)
+        self.quit_btn = tk.Button(self.window, text="Exit Program", command=self.exit)
+        self.forward_btn = tk.Button(self.window, text=">>", command=self.forward)
+        self.status_label = tk.Label(self.window, bd=1, relief="sunken", anchor="w")
 
         self.image_label.grid(row=0, column=0, columnspan=3)
-
-        self.back_btn = tk.Button(self.window, text="<<", command=self.back, state="disabled")
-        self.quit_btn = tk.Button(self.window, text="Exit Program",
-                                  command=lambda: [self.update_dict_text(1), self.deactivate()])
-        self.forward_btn = tk.Button(self.window, text=">>",
-                                     command=lambda: [self.update_dict_text(1), self.forward(2)])
-
         self.back_btn.grid(row=2, column=0)
         self.quit_btn.grid(row=2, column=1, pady=10)
         self.forward_btn.grid(row=2, column=2)
         self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
+        if self.suspects:
+            self.suspect_btn = tk.Button(self.window, text=f"Next low confidence page ({len(self.suspects)})",
+                                         command=self.next_suspect)
+            self.suspect_btn.grid(row=4, column=0, columnspan=3, pady=5)
 
         if self.only_images is False:
             self.image_text.focus()
 
-        self.window.bind('<Left>', lambda event: [self.back, self.left_btn()])
-        self.window.bind('<Right>', lambda event, n=2: [self.update_dict_text(n - 1),
-                                                        self.forward(n), self.right_btn()])
-        self.window.bind('<Return>', lambda event, n=2: [self.update_dict_text(n - 1),
-                                                         self.forward(n), self.right_btn()])
-        self.window.bind('<Escape>', lambda event: [self.update_dict_text(1), self.deactivate()])
+        self.window.bind('<Left>', lambda event: self.back())
+        self.window.bind('<Right>', lambda event: self.forward())
+        self.window.bind('<Return>', lambda event: self.forward())
+        self.window.bind('<Escape>', lambda event: self.exit())
+        self.window.bind('<Down>', lambda event: self.next_suspect())
+        self.window.bind('<Up>', lambda event: self.previous_suspect())
+
+        self.show_page(0)
 
     def activate(self):
         self.window.mainloop()
 
+    def page_image(self, image_number):
+        """Returns the PhotoImage of a page, which is kept until the next page is shown"""
+        self.photo = ImageTk.PhotoImage(self.loader.get(image_number))
+        return self.photo
+
     def deactivate(self):
         if self.only_images is False:
             # self.update_dict_text(self.img_num)
-            for num in range(1, len(os.listdir(os.path.join(self.image_dir, 'text')))+1):
-                with open(os.path.join(self.image_dir, 'text',
-                                       str(num).zfill(len(str(len(os.listdir(os.path.join(self.image_dir,
-                                                                                          'text'))))))+'.txt'),
-                          'w') as text_file:
-                    text_file.write(self.data_dict[num]['text'])
+            for num, page in self.data_dict.items():
+                text_file_name = page.get('text_file', page_index.page_name(num, len(self.data_dict)) + '.txt')
+                with open(os.path.join(self.image_dir, 'text', text_file_name), 'w') as text_file:
+                    text_file.write(page['text'])
+        if self.loader is not None:
+            self.loader.close()
         self.window.quit()
         self.window.destroy()
 
@@ -109,98 +124,52 @@ class PdfImageViewer:
         if self.only_images is False and image_number != 0:
             self.data_dict[image_number]['text'] = self.image_text.get()
 
-    def forward(self, image_number):
-
-        if image_number in self.data_dict:
-            self.image_label.grid_forget()
-            self.image_label = tk.Label(self.window, image=self.data_dict[image_number]['image'])
-            self.forward_btn = tk.Button(self.window, text=">>", command=lambda: [self.update_dict_text(image_number),
-                                                                                  self.forward(image_number + 1)])
-            self.back_btn = tk.Button(self.window, text="<<", command=lambda: [self.update_dict_text(image_number),
-                                                                               self.back(image_number - 1)])
-            self.quit_btn = tk.Button(self.window, text="Exit Program",
-                                      command=lambda: [self.update_dict_text(image_number), self.deactivate()])
-
-            self.window.bind('<Left>', lambda event, n=image_number - 1: [self.update_dict_text(image_number),
-                                                                          self.forward(n), self.left_btn()])
-            self.window.bind('<Right>', lambda event, n=image_number + 1: [self.update_dict_text(image_number),
-                                                                           self.back(n), self.right_btn()])
-            self.window.bind('<Return>', lambda event, n=image_number + 1: [self.update_dict_text(image_number),
-                                                                            self.back(n), self.right_btn()])
-            self.window.bind('<Escape>', lambda event: [self.update_dict_text(image_number), self.deactivate()])
-
-            self.status_label = tk.Label(self.window, text="Image {} of {}".format(image_number, len(self.data_dict)),
-                                         bd=1, relief="sunken", anchor="w")
-
-            if self.only_images is False:
-                # image_text.config('text') =
-                # self.image_text.grid_forget()
-                # self.image_text = tk.Label(self.window, text=self.data_dict[image_number]['text'])
-                # self.image_text = tk.Entry(self.window, justify='center')
-                # self.image_text.insert(0, self.data_dict[image_number]['text'])
-                self.image_text.delete(0, len(self.image_text.get()))
-                self.image_text.insert(0, self.data_dict[image_number]['text'])
-                self.image_text.grid(row=1, column=0, columnspan=3)
-
-            if image_number == len(self.data_dict):
-                self.forward_btn = tk.Button(self.window, text=">>", state="disabled")
-                self.window.bind('<Right>', lambda event: self.right_btn)
-
-            self.image_label.grid(row=0, column=0, columnspan=3)
-            self.back_btn.grid(row=2, column=0)
-            self.quit_btn.grid(row=2, column=1, pady=10)
-            self.forward_btn.grid(row=2, column=2)
-            self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
-
-    def back(self, image_number):
-
-        if image_number in self.data_dict:
-            self.image_label.grid_forget()
-            self.image_label = tk.Label(self.window, image=self.data_dict[image_number]['image'])
-            self.forward_btn = tk.Button(self.window, text=">>", command=lambda: [self.update_dict_text(image_number),
-                                                                                  self.forward(image_number + 1)])
-            self.back_btn = tk.Button(self.window, text="<<", command=lambda: [self.update_dict_text(image_number),
-                                                                               self.back(image_number - 1)])
-            self.quit_btn = tk.Button(self.window, text="Exit Program",
-                                      command=lambda: [self.update_dict_text(image_number), self.deactivate()])
-
-            self.window.bind('<Left>', lambda event, n=image_number - 1: [self.update_dict_text(image_number),
-                                                                          self.forward(n), self.left_btn()])
-            self.window.bind('<Right>', lambda event, n=image_number + 1: [self.update_dict_text(image_number),
-                                                                           self.back(n), self.right_btn()])
-            self.window.bind('<Return>', lambda event, n=image_number + 1: [self.update_dict_text(image_number),
-                                                                            self.back(n), self.right_btn()])
-            self.window.bind('<Escape>', lambda event: [self.update_dict_text(image_number), self.deactivate()])
-
-            self.status_label = tk.Label(self.window, text="Image {} of {}".format(image_number, len(self.data_dict)),
-                                         bd=1, relief="sunken", anchor="w")
-
-            if self.only_images is False:
-                # self.image_text.grid_forget()
-                # self.image_text = tk.Label(self.window, text=self.data_dict[image_number]['text'])
-                # self.image_text = tk.Entry(self.window, justify='center')
-                # self.image_text.insert(0, self.data_dict[image_number]['text'])
-                self.image_text.delete(0, len(self.image_text.get()))
-                self.image_text.insert(0, self.data_dict[image_number]['text'])
-                self.image_text.grid(row=1, column=0, columnspan=3)
+    def current_page(self):
+        return self.page_numbers[self.position]
 
-            if image_number == 1:
-                self.back_btn = tk.Button(self.window, text="<<", state="disabled")
-                self.window.bind('<Left>', lambda event: self.left_btn())
-
-            self.image_label.grid(row=0, column=0, columnspan=3)
-            self.back_btn.grid(row=2, column=0)
-            self.quit_btn.grid(row=2, column=1, pady=10)
-            self.forward_btn.grid(row=2, column=2)
-            self.status_label.grid(row=3, column=0, columnspan=3, sticky="w e")
-
-    def left_btn(self):
-        # print('left button pressed')
-        pass
-
-    def right_btn(self):
-        # print('right button pressed')
-        pass
+    def show_page(self, position):
+        """Shows the page at a position of the page list in the existing widgets"""
+        if position < 0 or position >= len(self.page_numbers):
+            return
+        self.position = position
+        image_number = self.page_numbers[position]
+        self.image_label.configure(image=self.page_image(image_number))
+        if self.only_images is False:
+            self.image_text.delete(0, tk.END)
+            self.image_text.insert(0, self.data_dict[image_number]['text'])
+        status = "Image {} of {}".format(position + 1, len(self.page_numbers))
+        if image_number in self.confidence:
+            status += " - OCR confidence {:.0f}".format(self.confidence[image_number])
+            if position in self.suspects:
+                status += " (low)"
+        self.status_label.configure(text=status)
+        self.back_btn.configure(state="disabled" if position == 0 else "normal")
+        self.forward_btn.configure(state="disabled" if position == len(self.page_numbers) - 1 else "normal")
+
+    def forward(self):
+        self.update_dict_text(self.current_page())
+        self.show_page(self.position + 1)
+
+    def back(self):
+        self.update_dict_text(self.current_page())
+        self.show_page(self.position - 1)
+
+    def next_suspect(self):
+        """Jumps to the next page with a low OCR confidence, starting over from the first one after the last"""
+        if self.suspects:
+            self.update_dict_text(self.current_page())
+            later = [position for position in self.suspects if position > self.position]
+            self.show_page(later[0] if later else self.suspects[0])
+
+    def previous_suspect(self):
+        if self.suspects:
+            self.update_dict_text(self.current_page())
+            earlier = [position for position in self.suspects if position < self.position]
+            self.show_page(earlier[-1] if earlier else self.suspects[-1])
+
+    def exit(self):
+        self.update_dict_text(self.current_page())
+        self.deactivate()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+import os
+import subprocess
+from scanned_pdf_sorter.image_formats import get_format
+
+
+def pdftoppm_command(poppler_path=None):
+    """Returns the path of the pdftoppm executable, using the poppler path when one is given"""
+    if poppler_path:
+        return os.path.join(poppler_path, 'pdftoppm')
+    return 'pdftoppm'
+
+
+def page_ranges(page_numbers):
+    """Groups page numbers into a list of (first page, last page) ranges of consecutive pages"""
+    ranges = []
+    for num in sorted(set(page_numbers)):
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1] = (ranges[-1][0], num)
+        else:
+            ranges.append((num, num))
+    return ranges
+
+
+def chunk_ranges(ranges, chunk_size):
+    """Splits (first page, last page) ranges into ranges of no more than chunk_size pages"""
+    chunk_size = max(chunk_size, 1)
+    chunks = []
+    for first_page, last_page in ranges:
+        for chunk_first in range(first_page, last_page + 1, chunk_size):
+            chunks.append((chunk_first, min(chunk_first + chunk_size - 1, last_page)))
+    return chunks
+
+
+def render_pages(pdf_path, output_prefix, dpi=200, first_page=None, last_page=None, image_type='png',
+                 poppler_path=None):
+    """Renders whole pdf pages, saving one '<output_prefix>-<page>' image per page in the format of image_type"""
+    run_pdftoppm(['-r', str(dpi)], pdf_path, output_prefix, first_page, last_page, image_type, poppler_path)
+
+
+def render_region(pdf_path, output_prefix, crop_coords, dpi=200, first_page=None, last_page=None, image_type='png',
+                  poppler_path=None):
+    """Renders only the crop box region of the pdf pages, saving one '<output_prefix>-<page>' image per page
+
+    The crop coordinates are (left, upper, right, lower) in pixels at the given dpi, so the saved images match the
+    images that cropping a full page render would produce
+    """
+    left, upper, right, lower = crop_coords
+    args = ['-r', str(dpi), '-x', str(left), '-y', str(upper), '-W', str(right - left), '-H', str(lower - upper)]
+    run_pdftoppm(args, pdf_path, output_prefix, first_page, last_page, image_type, poppler_path)
+
+
+def startupinfo():
+    """Returns the startupinfo that keeps a subprocess from opening a console window on windows, or None elsewhere"""
+    if os.name != 'nt':
+        return None
+    info = subprocess.STARTUPINFO()
+    info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return info
+
+
+def run_pdftoppm(args, pdf_path, output_prefix, first_page=None, last_page=None, image_type='png', poppler_path=None):
+    args = [pdftoppm_command(poppler_path)] + args
+    if first_page is not None:
+        args.extend(['-f', str(first_page)])
+    if last_page is not None:
+        args.extend(['-l', str(last_page)])
+    args.extend(get_format(image_type)['pdftoppm'])
+    args.extend([os.fspath(pdf_path), os.fspath(output_prefix)])
+
+    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo())
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftoppm failed: {result.stderr.decode('utf8', 'ignore').strip()}")
@@ -5,40 +5,78 @@ from tkinter import ttk
 from tkinter import filedialog
 from tkinter import scrolledtext
 from tkinter import messagebox
+import threading
 import configparser
+import multiprocessing
+from collections import deque
 from scanned_pdf_sorter.pdf_sorter_tools import SorterTools
+from scanned_pdf_sorter.job_runner import JobRunner
 from scanned_pdf_sorter.pdf_image_viewer import PdfImageViewer
 from scanned_pdf_sorter.crop_box_selector import PdfCropSelector
 from scanned_pdf_sorter.config_editor import ConfigEditor
 
 
 class StdoutRedirector:
-    def __init__(self, text_widget, root_widget, tab_size=4, text_color=None, secondary_output=sys.__stdout__):
+    """Sends the printed output to a text widget
+
+    A write only adds the text to a buffer, which a timer of the tk event loop moves into the text widget every
+    flush_interval milliseconds, so printing is cheap and can be done from any thread. The buffer holds complete
+    lines, with the unfinished end of the last line kept aside until its newline is written, so the buffer and the
+    text widget both keep only the last max_lines lines.
+    """
+
+    def __init__(self, text_widget, root_widget, tab_size=4, text_color=None, secondary_output=sys.__stdout__,
+                 flush_interval=100, max_lines=5000):
         self.text_area = text_widget
         self.tab_size = tab_size
         self.root_widget = root_widget
         self.text_color = text_color
         self.secondary_output = secondary_output
-
-    def write(self, string):
-        if isinstance(string, str) is False:
-            string = str(string)
-        self.text_area.configure(state='normal')
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.lines = deque(maxlen=max_lines)
+        self.partial = ''
+        self.lock = threading.Lock()
         try:
             self.text_area.configure(fg=self.text_color)
         except Exception:
             self.text_area.configure(fg=None)
-        self.text_area.insert('end', f"{string.expandtabs(self.tab_size)}")
-        print(string.expandtabs(self.tab_size), file=self.secondary_output, end='')
-        self.text_area.see('end')
-        self.text_area.configure(state='disabled')
-        self.root_widget.update()
+        self.root_widget.after(self.flush_interval, self.poll)
+
+    def write(self, string):
+        if isinstance(string, str) is False:
+            string = str(string)
+        string = string.expandtabs(self.tab_size)
+        with self.lock:
+            *lines, self.partial = (self.partial + string).split('\n')
+            self.lines.extend(f"{line}\n" for line in lines)
+        if self.secondary_output is not None:
+            print(string, file=self.secondary_output, end='')
+        return len(string)
 
     def flush(self):
+        if self.secondary_output is not None:
+            self.secondary_output.flush()
+
+    def poll(self):
+        self.drain()
+        self.root_widget.after(self.flush_interval, self.poll)
+
+    def drain(self):
+        """Moves the buffered text into the text widget, only call this from the tk thread"""
+        with self.lock:
+            if not self.lines and not self.partial:
+                return
+            text = ''.join(self.lines) + self.partial
+            self.lines.clear()
+            self.partial = ''
         self.text_area.configure(state='normal')
-        self.text_area.delete('1.0', 'end')
+        self.text_area.insert('end', text)
+        line_count = int(self.text_area.index('end-1c').split('.')[0])
+        if line_count > self.max_lines:
+            self.text_area.delete('1.0', f"{line_count - self.max_lines + 1}.0")
+        self.text_area.see('end')
         self.text_area.configure(state='disabled')
-        self.root_widget.update()
 
 
 class SorterApp(SorterTools):
@@ -53,6 +91,9 @@ class SorterApp(SorterTools):
 
     def __init__(self, root, config_file='config.ini'):
         super().__init__()
+        # pipeline stages run in a background thread so the window stays responsive
+        self.jobs = JobRunner(self)
+        self.record_listeners.append(self.show_record)
         self.root = root
         self.root.title("PDF SORTER")
         self.root.option_add('*tearOff', False)
@@ -70,8 +111,12 @@ class SorterApp(SorterTools):
         self.error_output.configure(state='disabled')
 
         # redirecting terminal and error output
-        sys.stdout = StdoutRedirector(self.terminal_output, self.root, self.tab_size, None, sys.__stdout__)
-        sys.stderr = StdoutRedirector(self.error_output, self.root, self.tab_size, 'Red', sys.__stderr__)
+        log_options = {'flush_interval': self.config.getint('SETTINGS', 'log_flush_interval', fallback=100),
+                       'max_lines': self.config.getint('SETTINGS', 'log_max_lines', fallback=5000)}
+        sys.stdout = StdoutRedirector(self.terminal_output, self.root, self.tab_size, None, sys.__stdout__,
+                                      **log_options)
+        sys.stderr = StdoutRedirector(self.error_output, self.root, self.tab_size, 'Red', sys.__stderr__,
+                                      **log_options)
 
         # building menu
         self.menuBar = tk.Menu(self.root)
@@ -79,12 +124,15 @@ class SorterApp(SorterTools):
 
         self.runMenu = tk.Menu(self.menuBar, tearoff=False)
         self.runMenu.add_command(label="Quick", command=lambda: [self.load_config(), self.run_quick()])
+        self.runMenu.add_command(label="Stream",
+                                 command=lambda: self.start_job('Stream', [self.run_stream], record=False))
         self.runMenu.add_command(label="Clean", command=lambda: self.output_clean(confirmation_box=True))
         self.runMenu.add_separator()
-        self.runMenu.add_command(label="Splitter", command=lambda: [self.load_config(), self.run_splitter()])
-        self.runMenu.add_command(label='Crop Images', command=lambda: [self.load_config(), self.run_cropping()])
-        self.runMenu.add_command(label='OCR', command=lambda: [self.load_config(), self.run_ocr()])
-        self.runMenu.add_command(label='Merge', command=lambda: [self.load_config(), self.run_merge()])
+        self.runMenu.add_command(label="Splitter", command=lambda: self.start_job('Splitter', [self.run_splitter]))
+        self.runMenu.add_command(label='Crop Images', command=lambda: self.start_job('Cropping', [self.run_cropping]))
+        self.runMenu.add_command(label='OCR', command=lambda: self.start_job('OCR', [self.run_ocr]))
+        self.runMenu.add_command(label='Merge', command=lambda: self.start_job('Merge', [self.run_merge]))
+        self.runMenu.add_command(label='Cancel', command=lambda: self.jobs.cancel())
         self.runMenu.add_separator()
         self.runMenu.add_command(label='JSON', command=lambda: self.save_pdf_dict())
         self.runMenu.add_separator()
@@ -111,12 +159,18 @@ class SorterApp(SorterTools):
         self.input_label = tk.Label(self.left_frame, text='Input File')
         self.left_spacer = tk.Label(self.left_frame, padx=8)
         self.input_file_btn = tk.Button(self.left_frame, text='INPUT FILE', command=self.select_input_file)
+        self.progress_label = tk.Label(self.left_frame, text='Idle', anchor='w', justify='left', wraplength=220)
+        self.progress_bar = ttk.Progressbar(self.left_frame, orient='horizontal', mode='determinate', length=220)
+        self.cancel_btn = tk.Button(self.left_frame, text='CANCEL', state='disabled', command=self.jobs.cancel)
 
         # packing left frame
         self.left_frame.pack(padx=0, pady=0, side='left', fill='y')
         self.input_label.grid(row=0, column=0, sticky='w')
         self.left_spacer.grid(row=0, column=1)
         self.input_file_btn.grid(row=0, column=2, sticky='ew')
+        self.progress_label.grid(row=1, column=0, columnspan=3, sticky='ew', pady=(8, 0))
+        self.progress_bar.grid(row=2, column=0, columnspan=3, sticky='ew')
+        self.cancel_btn.grid(row=3, column=2, sticky='ew', pady=4)
 
         # packing right frame
         self.right_frame.pack(padx=0, pady=0, side='left', expand=True, fill='both')
@@ -131,6 +185,84 @@ class SorterApp(SorterTools):
 
         self.root.protocol('WM_DELETE_WINDOW', lambda: self.deactivate(confirmation_box=True))
         self.root.deiconify()
+        self.root.after(100, self.poll_jobs)
+
+    def start_job(self, name, steps, then=None, record=True):
+        """Runs pipeline stages in the background, after reloading the config file on the tk thread
+
+        When record is set, the job gets a run log of its own, which is saved once its steps have finished. Jobs that
+        start their own run log, or that are part of one, such as the steps of quick, pass record=False
+        """
+        self.load_config()
+        if record and self.jobs.running() is False:
+            self.start_recording()
+            steps = list(steps) + [self.finish_recording]
+        if self.jobs.start(name, steps, then=then):
+            self.cancel_btn.configure(state='normal')
+            self.set_job_entries('disabled')
+            self.progress_bar.configure(value=0)
+            self.progress_label.configure(text=f"{name} running")
+
+    def poll_jobs(self):
+        """Shows the progress messages of the background job and runs the next step of a finished job"""
+        for message in self.jobs.poll():
+            if message['type'] == 'progress':
+                text = f"{message['stage']}: {message['done']} of {message['total']}"
+                if message['eta'] is not None:
+                    text += f", about {int(message['eta']) // 60}:{int(message['eta']) % 60:02d} left"
+                self.progress_label.configure(text=text)
+                self.progress_bar.configure(maximum=max(message['total'], 1), value=message['done'])
+            elif message['type'] == 'started':
+                self.progress_label.configure(text=f"{message['job']} running")
+            else:
+                self.cancel_btn.configure(state='disabled')
+                self.set_job_entries('normal')
+                self.progress_label.configure(text=f"{message['job']} {message['type']}")
+                if message['type'] == 'finished' and message['then'] is not None:
+                    message['then']()
+        self.root.after(100, self.poll_jobs)
+
+    @staticmethod
+    def show_record(record):
+        """Record listener that prints each finished stage of the run log to the log tab, the page records are only
+        kept in run_log.jsonl"""
+        if record.get('page') is None:
+            print(f"-stage {record['stage']}: {record.get('wall', 0):.2f}s, cpu {record.get('cpu', 0):.2f}s, "
+                  f"child cpu {record.get('child_cpu', 0):.2f}s, "
+                  f"written {(record.get('write_bytes') or 0) / 1e6:.1f} MB")
+
+    def set_job_entries(self, state):
+        """Sets the state of the menu entries that read or write the output directory or the config file, so they can
+        not run while a job is using them
+
+        The viewers rewrite the text files and clear the OCR results when they close, and the crop selector and config
+        editor change the crop box that a running job reads, so the whole Viewers and Options menus are disabled
+        """
+        for label in ('Quick', 'Stream', 'Clean', 'Splitter', 'Crop Images', 'OCR', 'Merge', 'JSON'):
+            self.runMenu.entryconfigure(label, state=state)
+        for label in ('Viewers', 'Options'):
+            self.menuBar.entryconfigure(label, state=state)
+
+    def run_quick(self):
+        """Runs the splitter, cropper, ocr, and merge in the background, with the crop selector and the viewer opened
+        on the tk thread in between"""
+        if self.jobs.running():
+            print("-Unable to run quick, another job is still running")
+        elif self.run_check():
+            print("-Starting quick")
+            self.start_recording()
+            self.start_job('Quick splitter', [self.run_splitter], then=self.quick_after_splitter, record=False)
+        else:
+            print("-Unable to run quick")
+
+    def quick_after_splitter(self):
+        self.run_crop_selector()
+        self.start_job('Quick OCR', [self.run_cropping, self.run_ocr], then=self.quick_after_ocr, record=False)
+
+    def quick_after_ocr(self):
+        self.run_main_viewer()
+        self.start_job('Quick merge', [self.run_merge, self.finish_recording], then=lambda: print("-Stopping quick"),
+                       record=False)
 
     def clear_term(self):
         """deletes all text from the text box"""
@@ -185,7 +317,8 @@ class SorterApp(SorterTools):
     def run_crop_selector(self):
         """Opens a tkinter window and allows the user to select which area all of the images should be cropped to"""
         print('-Starting Crop Box Selector')
-        crop_selector = PdfCropSelector((self.output_dir + '/images'),
+        self.ensure_page_images(page_numbers=[1])
+        crop_selector = PdfCropSelector((self.output_dir + '/images'), thumbnail_dir=self.thumbnail_dir(),
                                         size_divisor=self.config.getint('SETTINGS', 'crop_select_divisor', fallback=3),
                                         box_coords=[self.config.getint('CROP_BOX', 'start_x'),
                                                     self.config.getint('CROP_BOX', 'start_y'),
@@ -213,11 +346,15 @@ class SorterApp(SorterTools):
     def run_crop_viewer(self):
         """Opens a tkinter window to check and see if the crop box selection is what is desired"""
         viewer = PdfImageViewer((self.output_dir + '/crops'), only_images_boolean=True,
-                                size_divisor=self.config.getint('SETTINGS', 'crop_display_divisor', fallback=2))
+                                thumbnail_dir=self.thumbnail_dir(),
+                                size_divisor=self.config.getint('SETTINGS', 'crop_display_divisor', fallback=2),
+                                prefetch=self.config.getint('SETTINGS', 'viewer_prefetch', fallback=2),
+                                cache_size=self.config.getint('SETTINGS', 'viewer_cache_size', fallback=16))
         viewer.activate()
 
 
 def main(config_file='config.ini'):
+    multiprocessing.freeze_support()
     app = SorterApp(tk.Tk(), config_file)
     app.activate()
 
@@ -1,17 +1,33 @@
 import os
 import sys
 import json
+import time
 import shutil
+import tempfile
+import threading
+import functools
 import configparser
-import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from zipfile import ZipFile
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pypdf import PdfReader, PdfWriter
 from scanned_pdf_sorter.pdf_image_config import default_config_create
-from scanned_pdf_sorter.pdf_image_viewer import PdfImageViewer
 from scanned_pdf_sorter.mssql_query import MsSqlQuery
+from scanned_pdf_sorter.lookup_cache import LookupCache
+from scanned_pdf_sorter.image_loader import ThumbnailCache
+from scanned_pdf_sorter import ocr_tools
+from scanned_pdf_sorter import ocr_backends
+from scanned_pdf_sorter import crop_tools
+from scanned_pdf_sorter import image_formats
+from scanned_pdf_sorter import preprocess
+from scanned_pdf_sorter import pdf_render
+from scanned_pdf_sorter import page_index
+from scanned_pdf_sorter import stage_manifest
+from scanned_pdf_sorter.stage_manifest import StageManifest
+from scanned_pdf_sorter.instrumentation import RunRecorder, recorded_stage
 
 
 class SorterTools:
@@ -29,7 +45,19 @@ class SorterTools:
         self.database = None
         self.db_connected = False
         self.output_dict = {}
+        # page number to extracted text of the pages that have been scanned
+        self.ocr_results = {}
+        # page number to the OCR confidence record of the pages that have been scanned, saved into confidence.json
+        self.ocr_confidence = {}
         self.crop_box = {'start': {}, 'end': {}}
+        # config values that are set after every read of the config file, used by headless runs
+        self.config_overrides = {}
+        # the last unknown image_type that was warned about, so the warning is printed once instead of on every save
+        self.image_type_warned = None
+        self.recorder = RunRecorder()
+        self.record_listeners = []
+        # functions that are called with (stage, pages done, pages total), a listener may raise to stop the stage
+        self.progress_listeners = []
 
         # loading config file contents
         self.config = configparser.ConfigParser()
@@ -38,6 +66,9 @@ class SorterTools:
         default_config_create(self.config_file)
         self.load_box_config()
         print(f"-Loading crop box coordinates from {self.config_file}")
+        self.lookup_cache = LookupCache(max_size=self.config.getint('SETTINGS', 'lookup_cache_size', fallback=1024),
+                                        ttl=self.config.getint('SETTINGS', 'lookup_cache_ttl', fallback=86400),
+                                        db_file=self.config.get('SETTINGS', 'lookup_cache_file', fallback='') or None)
 
         self.output_dir = f"{os.getcwd()}/pdf_sorter_out"
         print(f"-Selected Directory: {self.output_dir}")
@@ -61,6 +92,16 @@ class SorterTools:
 
     def load_config(self):
         self.config.read(self.config_file)
+        for (section, option), value in self.config_overrides.items():
+            if self.config.has_section(section) is False:
+                self.config.add_section(section)
+            self.config.set(section, option, str(value))
+        image_type = self.image_type()
+        if image_formats.is_image_type(image_type):
+            self.image_type_warned = None
+        elif image_type != self.image_type_warned:
+            print(f"-Unknown image_type {image_type}, using png")
+            self.image_type_warned = image_type
 
     def write_config(self):
         with open(f"{self.config_file}", 'w') as config_file:
@@ -76,6 +117,17 @@ class SorterTools:
         else:
             print(f"-Unable to load crop box coordinates {self.config_file}")
 
+    def get_crop_coords(self):
+        """Returns the crop box as a (left, upper, right, lower) tuple"""
+        return (self.crop_box['start']['x'], self.crop_box['start']['y'],
+                self.crop_box['end']['x'], self.crop_box['end']['y'])
+
+    def input_path(self):
+        """Returns the full path of the selected input file, which may be a path or an opened file"""
+        if isinstance(self.input_file, (str, os.PathLike)):
+            return os.fspath(self.input_file)
+        return self.input_file.name
+
     def select_input_file(self):
         self.input_file = Path(input('Input PDf File Name: '))
         if self.input_file:
@@ -84,8 +136,7 @@ class SorterTools:
             print("-Selected File: no pdf file selected")
 
     def select_output_dir(self):
-        self.output_dir = Path(input('Select Output Directory: '))
-        self.output_dir += '/pdf_sorter_out'
+        self.output_dir = os.path.join(input('Select Output Directory: '), 'pdf_sorter_out')
         print(f"-Selected Directory: {self.output_dir}")
 
     def run_check(self):
@@ -94,7 +145,7 @@ class SorterTools:
         print("-Running Check...")
         self.load_box_config()
         if self.input_file:
-            print(f"-file: {self.input_file.name}")
+            print(f"-file: {self.input_path()}")
             print(f"-dir: {self.output_dir}")
             print(f"-top left {str(self.crop_box['start'])}")
             print(f"-bottom right {str(self.crop_box['end'])}")
@@ -114,44 +165,208 @@ class SorterTools:
         """Function to run the functions for: splitter, cropper, and ocr in quick succession"""
         if self.run_check():
             print("-Starting quick")
+            self.start_recording()
             self.run_splitter()
             self.run_crop_selector()
             self.run_cropping()
             self.run_ocr()
             self.run_main_viewer()
             self.run_merge()
+            self.finish_recording()
             print("-Stopping quick")
         else:
             print("-Unable to run quick")
 
+    @recorded_stage('stream')
+    def stream_pipeline(self):
+        pages = self.stream_pages(self.input_path())
+        crops = self.stream_crops(pages)
+        texts = self.stream_ocr(crops)
+        try:
+            self.output_dict = self.stream_merge(texts)
+        finally:
+            ocr_backends.close_backends()
+
+    def run_stream(self):
+        """Runs the splitter, cropper, ocr, and merge as one in-memory page pipeline
+
+        Each page is rendered, cropped, scanned, and appended to its grouped pdf before the next page is handled,
+        the images, crops, and text folders are only written to when debug_files is enabled in the config file
+        """
+        if self.run_check():
+            print("-Starting stream")
+            self.start_recording()
+            self.output_clean()
+            self.create_output_dir()
+            self.stream_pipeline()
+            self.save_confidence()
+            self.write_pdf_dict()
+            self.finish_recording()
+            print("-Stopping stream")
+        else:
+            print("-Unable to run stream")
+
+    def run_batch(self):
+        """Runs the splitter, cropper, ocr, and merge without asking for any input, used by headless runs
+
+        Returns a summary dict with the number of pages and groups, or None if the check failed
+        """
+        if self.run_check():
+            print("-Starting batch")
+            self.start_recording()
+            self.run_splitter()
+            self.run_cropping()
+            self.run_ocr()
+            self.run_merge()
+            self.write_pdf_dict()
+            self.finish_recording()
+            print("-Stopping batch")
+            return {'pages': sum(len(group['pages']) for group in self.output_dict.values()),
+                    'groups': len(self.output_dict)}
+        else:
+            print("-Unable to run batch")
+            return None
+
     def run_main_viewer(self):
         """Displays the extracted images from the pdf as well as the information that was extracted from the OCR scan"""
+        from scanned_pdf_sorter.pdf_image_viewer import PdfImageViewer
         print("-Starting main viewer")
-        viewer = PdfImageViewer(self.output_dir,
-                                size_divisor=self.config.getint('SETTINGS', 'main_display_divisor', fallback=8))
+        self.ensure_page_images()
+        viewer = PdfImageViewer(self.output_dir, thumbnail_dir=self.thumbnail_dir(),
+                                size_divisor=self.config.getint('SETTINGS', 'main_display_divisor', fallback=8),
+                                prefetch=self.config.getint('SETTINGS', 'viewer_prefetch', fallback=2),
+                                cache_size=self.config.getint('SETTINGS', 'viewer_cache_size', fallback=16),
+                                confidence_threshold=self.config.getfloat('SETTINGS', 'ocr_confidence_threshold',
+                                                                          fallback=60))
         viewer.activate()
+        # the viewer saves the corrected text into the text folder
+        self.ocr_results = {}
         print("-Stopping main viewer")
 
+    def thumbnail_dir(self):
+        """Returns the folder of the thumbnail cache that is shared by the viewers, or None if it is turned off"""
+        if self.config.getboolean('SETTINGS', 'thumbnail_cache', fallback=True):
+            return f"{self.output_dir}/thumbs"
+        return None
+
+    def pregenerate_thumbnails(self, folder, size_divisors):
+        """Creates the viewer thumbnails of the images in an output folder in the background, if turned on"""
+        thumbnail_dir = self.thumbnail_dir()
+        if thumbnail_dir is None:
+            return None
+        if self.config.getboolean('SETTINGS', 'pregenerate_thumbnails', fallback=False) is False:
+            return None
+        image_files = [f"{self.output_dir}/{folder}/{file}" for file in self.page_files(folder).values()]
+        print(f"-Creating the thumbnails of {len(image_files)} {folder} in the background")
+        thread = threading.Thread(target=ThumbnailCache(thumbnail_dir).generate, args=(image_files, size_divisors),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def start_recording(self):
+        """Starts a new run log, which is saved into run_log.jsonl by finish_recording"""
+        profile_stages = [stage.strip() for stage in
+                          self.config.get('SETTINGS', 'profile_stages', fallback='').split(',') if stage.strip()]
+        self.recorder = RunRecorder(log_file=f"{self.output_dir}/run_log.jsonl", profile_stages=profile_stages,
+                                    profile_dir=self.output_dir)
+        for listener in self.record_listeners:
+            self.recorder.add_listener(listener)
+
+    def finish_recording(self):
+        """Saves the run log and prints a table of the time spent in each stage"""
+        self.recorder.finish()
+        print(self.line_string)
+        self.recorder.print_summary()
+        print(self.line_string)
+        print(f"-{self.recorder.log_file} created")
+
+    @recorded_stage('ocr')
     def run_ocr(self):
         if self.run_check():
             print("-Starting OCR")
             self.create_output_dir()
 
-            crop_list = os.listdir(f"{self.output_dir}/crops")
-            crop_list.sort(key=lambda x: x.split('-')[-1].split('.')[0])
-            for image_file in crop_list:
-                crop_filename = f"{self.output_dir}/crops/{image_file}"
-                self.image_extract_text(crop_filename)
+            # with crop_to_ocr the crop box is cut out of the page images in memory instead of read from crops
+            crop_to_ocr = self.crop_to_ocr()
+            source_folder = 'images' if crop_to_ocr else 'crops'
+            box = self.get_crop_coords() if crop_to_ocr else None
+            crop_files = self.page_files(source_folder)
+            manifest = self.load_manifest()
+            self.load_confidence()
+            if manifest is not None:
+                texts = self.page_files('text')
+                ocr_keys = {}
+                for image_file in crop_files.values():
+                    page_name = page_index.page_label(image_file)
+                    ocr_keys[page_name] = self.ocr_stage_key(manifest, page_name)
+                crop_files = {num: image_file for num, image_file in crop_files.items()
+                              if not (manifest.is_current(page_index.page_label(image_file), 'ocr',
+                                                          ocr_keys[page_index.page_label(image_file)])
+                                      and num in texts)}
+                print(f"-{len(ocr_keys) - len(crop_files)} pages already scanned, {len(crop_files)} pages to scan")
+            crop_list = list(crop_files.values())
+
+            workers = ocr_tools.worker_count(self.config.getint('SETTINGS', 'ocr_workers', fallback=0))
+            settings = self.ocr_settings()
+            # batch backends scan many crops per tesseract process, so they always go through the worker pool
+            batch_size = 1
+            if ocr_backends.batches(settings['backend']):
+                batch_size = max(self.config.getint('SETTINGS', 'ocr_batch_size', fallback=32), 1)
+            try:
+                if workers > 1 or batch_size > 1:
+                    print(f"-Running OCR with {workers} workers and the {settings['backend']} backend")
+                    crop_files = [f"{self.output_dir}/{source_folder}/{image_file}" for image_file in crop_list]
+                    scanned = ocr_tools.ocr_files(crop_files, workers, box=box, batch_size=batch_size, **settings)
+                    for done, (crop_filename, result) in enumerate(scanned, start=1):
+                        page_name = page_index.page_label(crop_filename)
+                        self.recorder.add({'stage': 'ocr_page', 'page': page_name, 'start': time.time(),
+                                           'wall': round(result.seconds, 6),
+                                           'tesseract_seconds': round(result.seconds, 6)})
+                        self.save_text(page_name, result.text)
+                        self.record_confidence(page_name, result)
+                        if manifest is not None:
+                            manifest.update(page_name, 'ocr', ocr_keys[page_name])
+                        self.report_progress('ocr', done, len(crop_list))
+                else:
+                    for done, image_file in enumerate(crop_list, start=1):
+                        crop_filename = f"{self.output_dir}/{source_folder}/{image_file}"
+                        self.image_extract_text(crop_filename, box=box)
+                        if manifest is not None:
+                            page_name = page_index.page_label(image_file)
+                            manifest.update(page_name, 'ocr', ocr_keys[page_name])
+                        self.report_progress('ocr', done, len(crop_list))
+                self.rescan_low_confidence(manifest)
+            finally:
+                # a cancelled run still keeps the pages that were scanned
+                self.save_confidence()
+                if manifest is not None:
+                    manifest.save()
+                ocr_backends.close_backends()
 
             print("-Stopping OCR")
         else:
             print("-Unable to start OCR")
 
-    def run_merge(self):
-        pdf_dict = self.get_pdf_dict()
+    def run_merge(self, pdf_dict=None):
+        if pdf_dict is None:
+            pdf_dict = self.get_pdf_dict()
+        self.output_dict = pdf_dict
+        self.merge_groups(pdf_dict)
+
+    @recorded_stage('merge')
+    def merge_groups(self, pdf_dict):
+        """Saves one pdf file for each group of pages"""
         print('-Starting merge')
-        for num, key in enumerate(pdf_dict.keys()):
-            pdf_images = pdf_dict[key]['images']
+        if self.config.get('SETTINGS', 'merge_engine', fallback='passthrough') == 'passthrough':
+            if self.input_file:
+                self.passthrough_merge(pdf_dict)
+                print('-Stopping merge')
+                return
+            print('-No pdf file selected, merging the page images instead')
+        self.ensure_page_images()
+        images = self.page_files('images')
+        for num, key in enumerate(pdf_dict.keys(), start=1):
+            pdf_images = [f"{self.output_dir}/images/{images[page_num]}" for page_num in pdf_dict[key]['pages']]
             img_list = []
             for img in pdf_images:
                 img_data = Image.open(img)
@@ -160,22 +375,49 @@ class SorterTools:
             im1 = img_list.pop(0)
             im1.save(f"{self.output_dir}/pdfs/pdf-{str(key)}.pdf", save_all=True, append_images=img_list)
             print(f"-file pdf-{str(key)}.pdf saved")
+            self.report_progress('merge', num, len(pdf_dict))
         print('-Stopping merge')
 
+    def passthrough_merge(self, pdf_dict):
+        """Copies the original pages of the input pdf file into the grouped pdf files without re-encoding them"""
+        reader = PdfReader(self.input_path())
+        for num, key in enumerate(pdf_dict.keys(), start=1):
+            writer = PdfWriter()
+            for page_num in pdf_dict[key]['pages']:
+                writer.add_page(reader.pages[page_num - 1])
+            with open(f"{self.output_dir}/pdfs/pdf-{str(key)}.pdf", 'wb') as pdf_file:
+                writer.write(pdf_file)
+            print(f"-file pdf-{str(key)}.pdf saved")
+            self.report_progress('merge', num, len(pdf_dict))
+
     def save_pdf_dict(self):
-        if os.path.isfile(os.path.join(self.output_dir, 'pdf_dict.json')):
-            shutil.rmtree(os.path.join(self.output_dir, 'pdf_dict.json'))
         self.output_dict = self.get_pdf_dict()
+        self.write_pdf_dict()
+
+    def write_pdf_dict(self):
+        """Saves the current page groups into pdf_dict.json"""
+        if os.path.isfile(os.path.join(self.output_dir, 'pdf_dict.json')):
+            os.remove(os.path.join(self.output_dir, 'pdf_dict.json'))
         with open(self.output_dir + '/pdf_dict.json', 'w') as json_file:
             json.dump(self.output_dict, json_file, indent=4)
         print(f"-{self.output_dir}/pdf_dict.json created")
 
+    @recorded_stage('splitter')
     def run_splitter(self):
         if self.run_check():
             print("-Starting pdf splitter")
             self.create_output_dir()
-            self.output_clean()
-            self.pdf_image_splitter(self.input_file)
+            if self.config.getboolean('SETTINGS', 'incremental', fallback=False):
+                self.incremental_splitter(self.input_path())
+            else:
+                self.output_clean()
+                if self.config.getboolean('SETTINGS', 'crop_first_render', fallback=False):
+                    self.create_output_dir()
+                    print("-Crop first render enabled, page images will be rendered when they are needed")
+                else:
+                    self.pdf_image_splitter(self.input_file)
+            self.pregenerate_thumbnails('images', [self.config.getint('SETTINGS', 'main_display_divisor', fallback=8),
+                                                   self.config.getint('SETTINGS', 'crop_select_divisor', fallback=3)])
             print("-Stopping pdf splitter")
         else:
             print("-Unable to start splitter")
@@ -206,52 +448,98 @@ class SorterTools:
         del crop_selector
         print('-Stopping Crop Box Selector')
 
+    @recorded_stage('cropping')
     def run_cropping(self):
         """Crops all of the pdf page images and saves them"""
         if self.run_check():
             print("-Starting image cropper")
             self.create_output_dir()
-            for img in os.listdir(f"{self.output_dir}/images"):
-                self.crop_image(f"{self.output_dir}/images/{img}")
+            manifest = self.load_manifest()
+            try:
+                if self.config.getboolean('SETTINGS', 'crop_first_render', fallback=False):
+                    self.pdf_crop_splitter(self.input_path(), manifest)
+                else:
+                    crop_to_ocr = self.crop_to_ocr()
+                    crops = self.page_files('crops')
+                    images = self.page_files('images')
+                    pending = []
+                    for num, img in images.items():
+                        if manifest is not None:
+                            page_name = page_index.page_label(img)
+                            crop_key = self.crop_stage_key(manifest, page_name)
+                            if manifest.is_current(page_name, 'crop', crop_key) and (crop_to_ocr or num in crops):
+                                continue
+                            if crop_to_ocr:
+                                # nothing is saved when the OCR scan crops in memory, the key only tracks the box
+                                manifest.update(page_name, 'crop', crop_key)
+                        if num in crops and crops[num] != os.path.basename(self.crop_file(img)):
+                            # the crop was saved with another image_type, it is replaced instead of kept next to it
+                            os.remove(f"{self.output_dir}/crops/{crops[num]}")
+                        pending.append(img)
+                    if manifest is not None:
+                        print(f"-{len(images) - len(pending)} crops are already up to date")
+                    if crop_to_ocr:
+                        print("-Crop to OCR enabled, the OCR scan crops the page images in memory")
+                    else:
+                        self.crop_images(pending, manifest)
+            finally:
+                # a cancelled run still keeps the pages that were cropped
+                if manifest is not None:
+                    manifest.save()
+            self.pregenerate_thumbnails('crops', [self.config.getint('SETTINGS', 'crop_display_divisor', fallback=2)])
             print("-Stopping image cropper")
         else:
             print("-Unable to start cropper")
 
+    @recorded_stage('grouping')
     def get_pdf_dict(self) -> dict:
         """Scans the folder structure and groups the pdf images by matching extracted information from the OCR scan"""
         self.create_output_dir()
 
         if self.run_check():
-            output_dict = {}
-            image_list = os.listdir(f"{self.output_dir}/images")
-            image_list.sort(key=lambda x: x.split('-')[-1].split('.')[0])
-            text_list = os.listdir(f"{self.output_dir}/text")
-            text_list.sort(key=lambda x: x.split('-')[-1].split('.')[0])
-
-            for image_file in image_list:
-                image_filename = f"{self.output_dir}/images/{image_file}"
-                image_num = image_filename.split('-')[-1].split('.')[0].zfill(
-                    len(str(len(text_list))))
-                with open(f"{self.output_dir}/text/{image_num}.txt") as text_file:
-                    extracted_text = text_file.read()
-
-                temp_set = []
-                if extracted_text in output_dict:
-                    for item in output_dict[extracted_text]['images']:
-                        temp_set.append(item)
-                    temp_set.append(image_filename)
-                    output_dict[extracted_text]['images'] = temp_set
-                else:
-                    output_dict[extracted_text] = {}
-                    temp_set.append(image_filename)
-                    output_dict[extracted_text]['images'] = temp_set
-                    output_dict[extracted_text]['email'] = self.query_database(extracted_text)
-                    output_dict[extracted_text]['pdf'] = f"{self.output_dir}/pdfs/pdf-{extracted_text}.pdf"
-
+            output_dict = self.group_pages(self.get_ocr_results(), self.page_files('images'))
+            emails = self.query_database_many(list(output_dict.keys()))
+            for key in output_dict:
+                output_dict[key]['email'] = emails[key]
+            self.report_lookup_cache()
             return output_dict
         else:
             return {'null': 'null'}
 
+    def group_pages(self, ocr_results, images=None) -> dict:
+        """Groups the pages by their extracted text in one pass over the OCR results, in page order
+
+        ocr_results maps each page number to its extracted text, and images maps page numbers to the names of their
+        page images, for the pages that have one
+        """
+        images = images or {}
+        output_dict = {}
+        for page_num in sorted(ocr_results):
+            extracted_text = ocr_results[page_num]
+            group = output_dict.get(extracted_text)
+            if group is None:
+                group = output_dict[extracted_text] = {}
+                group['images'] = []
+                group['pages'] = []
+                group['email'] = None
+                group['pdf'] = f"{self.output_dir}/pdfs/pdf-{extracted_text}.pdf"
+            if page_num in images:
+                group['images'].append(f"{self.output_dir}/images/{images[page_num]}")
+            group['pages'].append(page_num)
+        return output_dict
+
+    def get_ocr_results(self) -> dict:
+        """Returns the table of page number to extracted text
+
+        Pages that were scanned during this session are already in the table, the text folder is only read for the
+        pages that are missing from it, such as pages scanned by an earlier run
+        """
+        for page_num, text_file_name in self.page_files('text').items():
+            if page_num not in self.ocr_results:
+                with open(f"{self.output_dir}/text/{text_file_name}") as text_file:
+                    self.ocr_results[page_num] = text_file.read()
+        return self.ocr_results
+
     def create_output_dir(self):
         """Creates the folder structure to hold the files that are produced by this program"""
         try:
@@ -287,12 +575,16 @@ class SorterTools:
             if clean_message == 'yes':
                 try:
                     shutil.rmtree(self.output_dir)
+                    self.ocr_results = {}
+                    self.ocr_confidence = {}
                     print(f'-{self.output_dir} has been deleted')
                 except Exception:
                     print(f'-Error in cleaning {self.output_dir}')
         else:
             try:
                 shutil.rmtree(self.output_dir)
+                self.ocr_results = {}
+                self.ocr_confidence = {}
                 print(f'-{self.output_dir} has been deleted')
             except Exception:
                 print(f'-Error in cleaning {self.output_dir}')
@@ -300,56 +592,515 @@ class SorterTools:
     def pdf_image_splitter(self, input_file):
         """Splits the pdf file into pages and saves the contents as images"""
         self.create_output_dir()
-        print(f"-{input_file.name}")
-        print(f"-file {os.path.basename(input_file.name)} found")
+        if isinstance(input_file, (str, os.PathLike)):
+            input_path = os.fspath(input_file)
+        else:
+            input_path = input_file.name
+        print(f"-{input_path}")
+        print(f"-file {os.path.basename(input_path)} found")
+
+        print(f"-Extracting images from the pages of {os.path.basename(input_path)}...")
+        page_count = pdfinfo_from_path(input_path, poppler_path=self.poppler_path)['Pages']
+        self.render_pages(input_path, range(1, page_count + 1), stage='splitter')
+        print(f"-Extracted {len(self.page_files('images'))} images from {os.path.basename(input_path)}")
+
+    def pdf_crop_splitter(self, input_path, manifest=None):
+        """Renders only the crop box region of each pdf page and saves it into the crops folder
+
+        When a stage manifest is given, only the pages whose crop is missing or out of date are rendered
+        """
+        print(f"-Rendering the crop box of each page of {os.path.basename(input_path)}...")
+        page_ranges = [(None, None)]
+        crops = self.page_files('crops')
+        # page number to the page name and new crop key of the stale pages, a key is only written once the page's
+        # crop has been saved, so a cancelled run never marks an old crop as current
+        crop_keys = {}
+        if manifest is not None:
+            for page_name in sorted(manifest.data['pages'], key=int):
+                crop_key = self.crop_stage_key(manifest, page_name)
+                if manifest.is_current(page_name, 'crop', crop_key) and int(page_name) in crops:
+                    continue
+                crop_keys[int(page_name)] = (page_name, crop_key)
+            print(f"-{len(manifest.data['pages']) - len(crop_keys)} crops are already up to date")
+            page_ranges = pdf_render.page_ranges(crop_keys)
+        rendered = 0
+        for done, (first_page, last_page) in enumerate(page_ranges, start=1):
+            self.report_progress('cropping', done - 1, len(page_ranges))
+            pdf_render.render_region(input_path, f"{self.output_dir}/crops/crop", self.get_crop_coords(),
+                                     dpi=self.config.getint('SETTINGS', 'dpi', fallback=200),
+                                     first_page=first_page, last_page=last_page, image_type=self.image_type(),
+                                     poppler_path=self.poppler_path)
+            for img in [img for img in os.listdir(f"{self.output_dir}/crops") if img.startswith('crop-')]:
+                num = page_index.page_number(img)
+                crop_name = f"{page_index.page_label(img)}{os.path.splitext(img)[1]}"
+                old_crop = crops.get(num)
+                if old_crop is not None and old_crop != crop_name:
+                    os.remove(f"{self.output_dir}/crops/{old_crop}")
+                os.replace(f"{self.output_dir}/crops/{img}", f"{self.output_dir}/crops/{crop_name}")
+                if num in crop_keys:
+                    manifest.update(crop_keys[num][0], 'crop', crop_keys[num][1])
+                rendered += 1
+                print(f"-image {crop_name} saved")
+        self.report_progress('cropping', len(page_ranges), len(page_ranges))
+        print(f"-Rendered {rendered} crops from {os.path.basename(input_path)}")
+
+    def ensure_page_images(self, page_numbers=None):
+        """Renders the full page images that are missing from the images folder
+
+        Only used when crop first rendering is enabled, where the page images are rendered lazily for the steps that
+        need them, such as the viewers and the merge
+        """
+        if self.config.getboolean('SETTINGS', 'crop_first_render', fallback=False) is False or not self.input_file:
+            return
+        self.create_output_dir()
+        input_path = self.input_path()
+        page_count = pdfinfo_from_path(input_path, poppler_path=self.poppler_path)['Pages']
+        rendered = self.page_files('images')
+        if page_numbers is None:
+            page_numbers = range(1, page_count + 1)
+        missing = sorted(num for num in set(page_numbers) if num not in rendered and 1 <= num <= page_count)
+        if len(missing) == 0:
+            return
 
-        print(f"-Extracting images from the pages of {os.path.basename(input_file.name)}...")
-        pdf_file_images = convert_from_path(input_file.name, dpi=self.config.getint('SETTINGS', 'dpi', fallback=200),
-                                            poppler_path=self.poppler_path, paths_only=True, fmt="png", thread_count=4,
-                                            output_folder=f"{self.output_dir}/images")
-        print(f"-Extracted {len(pdf_file_images)} images from {os.path.basename(input_file.name)}")
+        print(f"-Rendering {len(missing)} page images from {os.path.basename(input_path)}...")
+        self.render_pages(input_path, missing)
+
+    def render_pages(self, input_path, page_numbers, stage='render'):
+        """Renders the given pages of the pdf file into the images folder
+
+        The pages are split into chunks of render_chunk_size pages, and render_workers pdftoppm processes each render
+        one chunk at a time straight into the images folder. Only the file names of the rendered pages are kept, so
+        memory use does not grow with the number of pages.
+        """
+        page_count = len(page_numbers)
+        chunk_size = self.config.getint('SETTINGS', 'render_chunk_size', fallback=50)
+        chunks = pdf_render.chunk_ranges(pdf_render.page_ranges(page_numbers), chunk_size)
+        workers = min(ocr_tools.worker_count(self.config.getint('SETTINGS', 'render_workers', fallback=4)),
+                      max(len(chunks), 1))
+        done = 0
+        self.report_progress(stage, done, page_count)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.render_chunk, input_path, first_page, last_page): (first_page, last_page)
+                       for first_page, last_page in chunks}
+            try:
+                for future in as_completed(futures):
+                    first_page, last_page = futures[future]
+                    self.recorder.add({'stage': 'render_pages', 'page': f"{first_page}-{last_page}",
+                                       'start': time.time(), 'wall': round(future.result(), 6)})
+                    done += last_page - first_page + 1
+                    self.report_progress(stage, done, page_count)
+            except BaseException:
+                # a cancelled or failed render does not start the chunks that are still waiting
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def render_chunk(self, input_path, first_page, last_page):
+        """Renders one chunk of pages with its own pdftoppm process, returns the seconds that it took"""
+        start_time = time.perf_counter()
+        pdf_render.render_pages(input_path, f"{self.output_dir}/images/page",
+                                dpi=self.config.getint('SETTINGS', 'dpi', fallback=200), first_page=first_page,
+                                last_page=last_page, image_type=self.image_type(), poppler_path=self.poppler_path)
+        return time.perf_counter() - start_time
+
+    def image_type(self):
+        """Returns the image_type that the page images and crops are saved as"""
+        return self.config.get('SETTINGS', 'image_type', fallback='png')
+
+    def incremental_splitter(self, input_path):
+        """Renders only the pages of the pdf file whose contents or render settings changed since the last run"""
+        crop_first = self.config.getboolean('SETTINGS', 'crop_first_render', fallback=False)
+        dpi = self.config.getint('SETTINGS', 'dpi', fallback=200)
+        image_type = self.image_type()
+        manifest = self.load_manifest()
+        pdf_hash = stage_manifest.file_hash(input_path)
+        if manifest.data['input'].get('hash') == pdf_hash:
+            page_hashes = manifest.data['input']['page_hashes']
+        else:
+            print(f"-Hashing the pages of {os.path.basename(input_path)}...")
+            page_hashes = stage_manifest.page_hashes(input_path)
+        previous_pages = manifest.data['input'].get('page_hashes')
+        if previous_pages is not None and len(str(len(previous_pages))) != len(str(len(page_hashes))):
+            # page names are zero padded to the number of digits of the page count, so all names change
+            self.output_clean()
+            self.create_output_dir()
+            manifest.reset()
+
+        images = self.page_files('images')
+        stale = []
+        for num, page_hash in enumerate(page_hashes, start=1):
+            page_name = page_index.page_name(num, len(page_hashes))
+            render_key = stage_manifest.stage_key(page=page_hash, dpi=dpi, image_type=image_type)
+            if manifest.is_current(page_name, 'render', render_key) and (crop_first or num in images):
+                continue
+            stale.append(num)
+            manifest.update(page_name, 'render', render_key)
+            if num in images:
+                os.remove(f"{self.output_dir}/images/{images[num]}")
+        for page_name in list(manifest.data['pages']):
+            if int(page_name) > len(page_hashes):
+                self.remove_page_outputs(int(page_name))
+                manifest.remove_page(page_name)
+
+        print(f"-{len(page_hashes) - len(stale)} pages are already up to date, {len(stale)} pages changed")
+        if crop_first is False and len(stale) > 0:
+            self.render_pages(input_path, stale)
+        manifest.data['input'] = {'hash': pdf_hash, 'dpi': dpi, 'page_hashes': page_hashes}
+        manifest.save()
+
+    def load_manifest(self):
+        """Returns the stage manifest of the output directory, or None when incremental runs are disabled"""
+        if self.config.getboolean('SETTINGS', 'incremental', fallback=False):
+            return StageManifest(f"{self.output_dir}/manifest.json")
+        return None
+
+    def crop_stage_key(self, manifest, page_name):
+        return stage_manifest.stage_key(render=manifest.get_key(page_name, 'render'), crop=self.get_crop_coords())
+
+    def ocr_stage_key(self, manifest, page_name):
+        return stage_manifest.stage_key(crop=manifest.get_key(page_name, 'crop'), ocr=self.ocr_settings())
+
+    def rescan_stage_key(self, manifest, page_name, rescan_dpi):
+        return stage_manifest.stage_key(ocr=manifest.get_key(page_name, 'ocr'), dpi=rescan_dpi)
+
+    def ocr_settings(self):
+        """Returns the tesseract and preprocessing settings that the OCR scan uses, as keyword arguments of
+        ocr_tools.extract_text_timed"""
+        settings = {'lang': 'eng', 'config': '', 'preprocess_steps': (), 'target_height': 32,
+                    'backend': self.config.get('SETTINGS', 'ocr_backend', fallback='pytesseract')}
+        if self.config.getboolean('SETTINGS', 'ocr_digits_only', fallback=False):
+            settings['config'] = ocr_tools.digits_config
+        settings['preprocess_steps'] = preprocess.parse_steps(self.config.get('SETTINGS', 'ocr_preprocess',
+                                                                              fallback=''))
+        settings['target_height'] = self.config.getint('SETTINGS', 'ocr_target_height', fallback=32)
+        return settings
+
+    def report_progress(self, stage, done, total):
+        """Passes the progress of a stage to the progress listeners"""
+        for listener in self.progress_listeners:
+            listener(stage, done, total)
+
+    def page_files(self, folder):
+        """Returns a dict of page number to file name for the files inside one of the output folders, in page order"""
+        return page_index.page_files(f"{self.output_dir}/{folder}")
+
+    def remove_page_outputs(self, page_num):
+        """Deletes the image, crop, and text files of one page"""
+        self.ocr_results.pop(page_num, None)
+        self.ocr_confidence.pop(page_num, None)
+        for folder in ('images', 'crops', 'text'):
+            page_file = self.page_files(folder).get(page_num)
+            if page_file is not None:
+                os.remove(f"{self.output_dir}/{folder}/{page_file}")
+
+    def crop_to_ocr(self):
+        """Returns True if the OCR scan crops the page images itself, which crop first rendering takes priority over"""
+        if self.config.getboolean('SETTINGS', 'crop_first_render', fallback=False):
+            return False
+        return self.config.getboolean('SETTINGS', 'crop_to_ocr', fallback=False)
+
+    def crop_images(self, image_files, manifest=None):
+        """Crops the given files of the images folder, split across processes when crop_workers allows it
+
+        When a manifest is given, the crop key of each page is written once its crop has been saved, so a cancelled
+        run never marks a page that was not cropped as current
+        """
+        workers = ocr_tools.worker_count(self.config.getint('SETTINGS', 'crop_workers', fallback=0))
+        if workers > 1 and len(image_files) > 1:
+            print(f"-Cropping with {workers} workers")
+            jobs = ((img, (f"{self.output_dir}/images/{img}", self.get_crop_coords(), self.crop_file(img),
+                           self.image_type())) for img in image_files)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                cropped = ocr_tools.ordered_map(executor, crop_tools.crop_file, jobs, workers * 4)
+                for done, (img, crop_seconds) in enumerate(cropped, start=1):
+                    self.recorder.add({'stage': 'crop_page', 'page': page_index.page_label(img), 'start': time.time(),
+                                       'wall': round(crop_seconds, 6)})
+                    print(f"-image {os.path.basename(self.crop_file(img))} saved")
+                    self.update_crop_key(manifest, img)
+                    self.report_progress('cropping', done, len(image_files))
+        else:
+            for done, img in enumerate(image_files, start=1):
+                self.crop_image(f"{self.output_dir}/images/{img}")
+                self.update_crop_key(manifest, img)
+                self.report_progress('cropping', done, len(image_files))
+
+    def update_crop_key(self, manifest, img_name):
+        """Marks the crop of a page image as current in the manifest, when there is one"""
+        if manifest is not None:
+            page_name = page_index.page_label(img_name)
+            manifest.update(page_name, 'crop', self.crop_stage_key(manifest, page_name))
+
+    def crop_file(self, img_name):
+        """Returns the path of the crop of a page image, named after the page with the extension of image_type"""
+        return f"{self.output_dir}/crops/{page_index.page_label(img_name)}{image_formats.extension(self.image_type())}"
 
     def crop_image(self, input_file):
-        """Crops the given image to the crop box that was selected"""
+        """Crops the given image to the crop box that was selected, only decoding the rows of the crop box"""
         img_name = os.path.basename(input_file)
         print(f"-image {img_name} found")
-        file_ext = img_name.split('.')[-1]
-
-        i = img_name.split('-')[-1].split('.')[0]
-        page = Image.open(input_file)
-        page = page.crop((self.crop_box['start']['x'],
-                          self.crop_box['start']['y'],
-                          self.crop_box['end']['x'],
-                          self.crop_box['end']['y']))
-        page.save(f"{self.output_dir}/crops/{i}.{file_ext}")
-        print(f"-image {i}.{file_ext} saved")
-
-    def image_extract_text(self, input_file):
-        """Runs an OCR scan to extract number from the given image and saves the extracted text"""
-        img_name = os.path.splitext(os.path.basename(input_file))[0]
-        text_data = pytesseract.image_to_string(Image.open(input_file), lang='eng')
-        text = self.replace_chars(text_data)
 
+        with self.recorder.stage('crop_page', page=page_index.page_label(img_name)):
+            crop_tools.crop_file(input_file, self.get_crop_coords(), self.crop_file(img_name), self.image_type())
+        print(f"-image {os.path.basename(self.crop_file(img_name))} saved")
+
+    def image_extract_text(self, input_file, box=None):
+        """Runs an OCR scan to extract number from the given image and saves the extracted text
+
+        When a box is given, the scan runs on that box of the image, which is cropped in memory
+        """
+        img_name = page_index.page_label(input_file)
+        with self.recorder.stage('ocr_page', page=img_name) as record:
+            if box is None:
+                image = Image.open(input_file)
+            else:
+                image = crop_tools.open_region(input_file, box)
+            result = ocr_tools.extract_text_timed(image, **self.ocr_settings())
+            record['tesseract_seconds'] = result.seconds
+            self.save_text(img_name, result.text)
+            self.record_confidence(img_name, result)
+        return result.text
+
+    def save_text(self, img_name, text):
+        """Saves the text that was extracted from an image into the text folder"""
+        self.ocr_results[page_index.page_number(img_name)] = text
         with open(f"{self.output_dir}/text/{img_name}.txt", 'w') as text_file:
-            if text.isdigit() is False:
-                text = '0'
             text_file.write(text)
             print(f"-{img_name}.txt saved")
             print(f"-text extracted: {text}")
-        return text
+
+    def record_confidence(self, img_name, result, dpi=None):
+        """Keeps the confidence of an OCR scan along with the confidence of each word and the dpi it was scanned at"""
+        if dpi is None:
+            dpi = self.config.getint('SETTINGS', 'dpi', fallback=200)
+        self.ocr_confidence[int(img_name)] = {'confidence': round(result.confidence, 2), 'dpi': dpi,
+                                              'words': [[word, round(conf, 2)] for word, conf in result.words]}
+
+    def load_confidence(self):
+        """Reads the confidence records of the pages that are not in the table yet, such as pages scanned by an earlier
+        run"""
+        confidence_file = f"{self.output_dir}/confidence.json"
+        if os.path.isfile(confidence_file):
+            try:
+                with open(confidence_file) as json_file:
+                    for page_num, record in json.load(json_file).items():
+                        self.ocr_confidence.setdefault(int(page_num), record)
+            except (OSError, ValueError):
+                print(f"-Unable to read {confidence_file}")
+        return self.ocr_confidence
+
+    def save_confidence(self):
+        if len(self.ocr_confidence) == 0:
+            return
+        with open(f"{self.output_dir}/confidence.json", 'w') as json_file:
+            json.dump({str(num): record for num, record in sorted(self.ocr_confidence.items())}, json_file, indent=4)
+        print(f"-{self.output_dir}/confidence.json created")
+
+    def low_confidence_pages(self, below_dpi=None):
+        """Returns the numbers of the pages whose OCR confidence is below ocr_confidence_threshold, leaving out the
+        pages that were already scanned at below_dpi or more"""
+        threshold = self.config.getfloat('SETTINGS', 'ocr_confidence_threshold', fallback=60)
+        return [num for num, record in sorted(self.ocr_confidence.items()) if record['confidence'] < threshold
+                and (below_dpi is None or record['dpi'] < below_dpi)]
+
+    def rescan_low_confidence(self, manifest=None):
+        """Renders the crop box of the pages with a low OCR confidence again at ocr_rescan_dpi and scans them again
+
+        The first scan can run on cheap low dpi renders, and only the few pages that it could not read well are
+        rendered at the higher dpi. Whichever of the two scans tesseract was more confident about is kept. When a
+        manifest is given, a 'rescan' key is written along with each page's text and confidence, so a page whose OCR
+        scan is redone is rescanned again as well.
+        """
+        dpi = self.config.getint('SETTINGS', 'dpi', fallback=200)
+        rescan_dpi = self.config.getint('SETTINGS', 'ocr_rescan_dpi', fallback=0)
+        if rescan_dpi <= dpi:
+            return
+        texts = self.page_files('text')
+        page_names = {num: page_index.page_label(texts[num]) if num in texts else str(num)
+                      for num in self.low_confidence_pages()}
+        low_pages = self.low_confidence_pages(below_dpi=rescan_dpi)
+        if manifest is not None:
+            stale_pages = [num for num, page_name in page_names.items()
+                           if not manifest.is_current(page_name, 'rescan',
+                                                      self.rescan_stage_key(manifest, page_name, rescan_dpi))]
+            low_pages = sorted(set(low_pages).union(stale_pages))
+        if len(low_pages) == 0:
+            return
+        if not self.input_file:
+            print("-Unable to rescan the pages with a low confidence, no pdf file selected")
+            return
+
+        print(f"-Rescanning {len(low_pages)} pages with a low confidence at {rescan_dpi} dpi")
+        # the crop box is in pixels of the first render, so it is scaled to the pixels of the rescan
+        crop_coords = tuple(round(coord * rescan_dpi / dpi) for coord in self.get_crop_coords())
+        done = 0
+        with tempfile.TemporaryDirectory(prefix='pdf_sorter_rescan_') as temp_dir:
+            for first_page, last_page in pdf_render.page_ranges(low_pages):
+                self.report_progress('rescan', done, len(low_pages))
+                pdf_render.render_region(self.input_path(), f"{temp_dir}/crop", crop_coords, dpi=rescan_dpi,
+                                         first_page=first_page, last_page=last_page, image_type=self.image_type(),
+                                         poppler_path=self.poppler_path)
+                crop_files = page_index.page_files(temp_dir)
+                results = ocr_tools.extract_files_text_timed([f"{temp_dir}/{file}" for file in crop_files.values()],
+                                                             **self.ocr_settings())
+                for num, result in zip(crop_files, results):
+                    page_name = page_names[num]
+                    self.recorder.add({'stage': 'ocr_rescan', 'page': page_name, 'start': time.time(),
+                                       'wall': round(result.seconds, 6),
+                                       'tesseract_seconds': round(result.seconds, 6)})
+                    if result.confidence > self.ocr_confidence[num]['confidence']:
+                        self.save_text(page_name, result.text)
+                        self.record_confidence(page_name, result, rescan_dpi)
+                    else:
+                        self.ocr_confidence[num]['dpi'] = rescan_dpi
+                    if manifest is not None:
+                        manifest.update(page_name, 'rescan', self.rescan_stage_key(manifest, page_name, rescan_dpi))
+                    os.remove(f"{temp_dir}/{crop_files[num]}")
+                done += last_page - first_page + 1
+        self.report_progress('rescan', done, len(low_pages))
+        print(f"-{len(self.low_confidence_pages())} pages are still below the confidence threshold")
 
     def replace_chars(self, text):
-        list_of_numbers = re.findall(r'\d+', text)
-        result_number = ''.join(list_of_numbers)
-        return result_number
+        return ocr_tools.replace_chars(text)
+
+    def stream_pages(self, input_path):
+        """Yields (page name, page image) pairs, rendering the pdf file a few pages at a time"""
+        page_count = pdfinfo_from_path(input_path, poppler_path=self.poppler_path)['Pages']
+        chunk_size = max(self.config.getint('SETTINGS', 'stream_chunk_size', fallback=8), 1)
+        debug_files = self.config.getboolean('SETTINGS', 'debug_files', fallback=False)
+        image_type = self.image_type()
+        print(f"-Streaming {page_count} pages from {os.path.basename(input_path)}")
+        for first_page in range(1, page_count + 1, chunk_size):
+            last_page = min(first_page + chunk_size - 1, page_count)
+            with self.recorder.stage('render_pages', page=f"{first_page}-{last_page}"):
+                page_images = convert_from_path(input_path, dpi=self.config.getint('SETTINGS', 'dpi', fallback=200),
+                                                poppler_path=self.poppler_path, first_page=first_page,
+                                                last_page=last_page, thread_count=1)
+            for page_num, page in enumerate(page_images, start=first_page):
+                page_name = page_index.page_name(page_num, page_count)
+                if debug_files:
+                    image_formats.save_image(
+                        page, f"{self.output_dir}/images/page-{page_name}{image_formats.extension(image_type)}",
+                        image_type)
+                self.report_progress('stream', page_num - 1, page_count)
+                yield page_name, page
+        self.report_progress('stream', page_count, page_count)
+
+    def stream_crops(self, pages):
+        """Yields (page name, page image, crop image) tuples for the given pages"""
+        debug_files = self.config.getboolean('SETTINGS', 'debug_files', fallback=False)
+        crop_coords = self.get_crop_coords()
+        image_type = self.image_type()
+        for page_name, page in pages:
+            with self.recorder.stage('crop_page', page=page_name):
+                crop = page.crop(crop_coords)
+                if debug_files:
+                    image_formats.save_image(
+                        crop, f"{self.output_dir}/crops/{page_name}{image_formats.extension(image_type)}", image_type)
+            yield page_name, page, crop
+
+    def stream_ocr(self, crops):
+        """Yields (page name, page image, extracted text) tuples for the given crops"""
+        debug_files = self.config.getboolean('SETTINGS', 'debug_files', fallback=False)
+        workers = ocr_tools.worker_count(self.config.getint('SETTINGS', 'ocr_workers', fallback=0))
+        if workers > 1:
+            with ocr_tools.ocr_pool(workers) as executor:
+                jobs = (((page_name, page), (crop,)) for page_name, page, crop in crops)
+                extract = functools.partial(ocr_tools.extract_text_timed, **self.ocr_settings())
+                scanned = ocr_tools.ordered_map(executor, extract, jobs, workers * 2)
+                for (page_name, page), result in scanned:
+                    self.recorder.add({'stage': 'ocr_page', 'page': page_name, 'start': time.time(),
+                                       'wall': round(result.seconds, 6),
+                                       'tesseract_seconds': round(result.seconds, 6)})
+                    self.record_confidence(page_name, result)
+                    yield self.stream_text(page_name, page, result.text, debug_files)
+        else:
+            for page_name, page, crop in crops:
+                with self.recorder.stage('ocr_page', page=page_name) as record:
+                    result = ocr_tools.extract_text_timed(crop, **self.ocr_settings())
+                    record['tesseract_seconds'] = result.seconds
+                self.record_confidence(page_name, result)
+                yield self.stream_text(page_name, page, result.text, debug_files)
+
+    def stream_text(self, page_name, page, text, debug_files=False):
+        """Reports the text extracted from a streamed page, and saves it when debug files are enabled"""
+        self.ocr_results[int(page_name)] = text
+        if debug_files:
+            with open(f"{self.output_dir}/text/{page_name}.txt", 'w') as text_file:
+                text_file.write(text)
+        print(f"-page {page_name} text extracted: {text}")
+        return page_name, page, text
+
+    def stream_merge(self, texts) -> dict:
+        """Groups the scanned pages by their extracted text and appends each page to the pdf of its group
+
+        The groups have the same shape as the groups of group_pages, where images only lists the page images that
+        debug_files saved
+        """
+        passthrough = self.config.get('SETTINGS', 'merge_engine', fallback='passthrough') == 'passthrough'
+        debug_files = self.config.getboolean('SETTINGS', 'debug_files', fallback=False)
+        image_extension = image_formats.extension(self.image_type())
+        output_dict = {}
+        for page_name, page, text in texts:
+            if text not in output_dict:
+                output_dict[text] = {}
+                output_dict[text]['images'] = []
+                output_dict[text]['pages'] = []
+                output_dict[text]['email'] = None
+                output_dict[text]['pdf'] = f"{self.output_dir}/pdfs/pdf-{text}.pdf"
+            if passthrough is False:
+                page.convert('RGB').save(output_dict[text]['pdf'], append=len(output_dict[text]['pages']) > 0)
+            if debug_files:
+                output_dict[text]['images'].append(f"{self.output_dir}/images/page-{page_name}{image_extension}")
+            output_dict[text]['pages'].append(int(page_name))
+        if passthrough:
+            self.passthrough_merge(output_dict)
+        else:
+            for key in output_dict:
+                print(f"-file pdf-{key}.pdf saved")
+        emails = self.query_database_many(list(output_dict.keys()))
+        for key in output_dict:
+            output_dict[key]['email'] = emails[key]
+        self.report_lookup_cache()
+        return output_dict
 
     def connect_to_database(self):
         self.database = MsSqlQuery(config_file=self.config_file)
         self.db_connected = self.database.build_connection(trusted=False)
 
     def query_database(self, db_query_txt):
-        if self.db_connected:
-            text = self.database.database_query(db_query_txt)
-            return text
-        else:
-            return None
+        return self.query_database_many([db_query_txt])[db_query_txt]
+
+    def query_database_many(self, db_query_list):
+        """Looks up every given customer number and returns a dict of number to email
+
+        Numbers are first looked up in the lookup cache, the rest are looked up with batched database queries. If the
+        database can not be reached, expired cache entries are used instead
+        """
+        results = {}
+        missing = []
+        for db_query_txt in db_query_list:
+            found, email = self.lookup_cache.get(db_query_txt)
+            if found:
+                results[db_query_txt] = email
+            else:
+                missing.append(db_query_txt)
+
+        if missing and self.db_connected:
+            try:
+                emails = self.database.database_query_many(missing)
+                for db_query_txt in missing:
+                    self.lookup_cache.set(db_query_txt, emails[db_query_txt])
+                results.update(emails)
+                missing = []
+            except Exception as e:
+                print(f"-Database lookup failed: {e}")
+
+        for db_query_txt in missing:
+            results[db_query_txt] = self.lookup_cache.get_stale(db_query_txt)[1]
+        return results
+
+    def report_lookup_cache(self):
+        """Prints the hit and miss counters of the lookup cache"""
+        stats = self.lookup_cache.stats()
+        print(f"-Lookup cache: {stats['hits']} hits, {stats['misses']} misses, {stats['stale_hits']} stale hits, "
+              f"{stats['size']} entries")
@@ -0,0 +1,101 @@
+import math
+import numpy as np
+from PIL import Image
+
+# the steps that preprocess() can run, in the order that they are run
+steps = ('gray', 'otsu', 'deskew', 'scale')
+
+
+def parse_steps(value):
+    """Converts a comma separated list of steps from the config file into a tuple in running order"""
+    names = {name.strip().lower() for name in value.split(',') if name.strip()}
+    unknown = names - set(steps)
+    if unknown:
+        print(f"-Unknown preprocessing steps ignored: {', '.join(sorted(unknown))}")
+    return tuple(step for step in steps if step in names)
+
+
+def to_gray(image):
+    """Returns the image as a 2d uint8 array of gray values"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image, dtype=np.uint8)
+
+
+def otsu_threshold(gray):
+    """Returns the gray value that best splits the pixels into dark text and light background (Otsu's method)"""
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    sums = np.cumsum(histogram * np.arange(256))
+    total_weight, total_sum = weights[-1], sums[-1]
+    background = total_weight - weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_dark = sums / weights
+        mean_light = (total_sum - sums) / background
+        variance = weights * background * (mean_dark - mean_light) ** 2
+    variance[~np.isfinite(variance)] = 0
+    return int(np.argmax(variance))
+
+
+def binarize(gray):
+    """Returns the gray array as black text (0) on a white background (255)"""
+    binary = np.where(gray > otsu_threshold(gray), 255, 0).astype(np.uint8)
+    # a crop that is mostly dark is white text on a dark background, so it is flipped
+    if np.count_nonzero(binary) < binary.size / 2:
+        binary = 255 - binary
+    return binary
+
+
+def skew_angle(gray, max_angle=5.0, angle_step=0.5):
+    """Returns the angle in degrees that the text lines of the array are rotated by
+
+    The dark pixels are projected onto the rows for each candidate angle at once, and the angle whose row profile has
+    the sharpest peaks, where every text line falls onto the fewest rows, is the skew of the text
+    """
+    ys, xs = np.nonzero(gray < 128)
+    if len(ys) < 2:
+        return 0.0
+    angles = np.arange(-max_angle, max_angle + angle_step / 2, angle_step)
+    radians = np.deg2rad(angles)[:, np.newaxis]
+    rows = np.round(ys * np.cos(radians) - xs * np.sin(radians)).astype(np.int64)
+    rows -= rows.min(axis=1, keepdims=True)
+    scores = [np.square(np.bincount(angle_rows).astype(np.float64)).sum() for angle_rows in rows]
+    return float(angles[int(np.argmax(scores))])
+
+
+def deskew(gray, max_angle=5.0, angle_step=0.5):
+    angle = skew_angle(gray, max_angle, angle_step)
+    if angle == 0:
+        return gray
+    rotated = Image.fromarray(gray).rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    return np.asarray(rotated, dtype=np.uint8)
+
+
+def text_height(gray):
+    """Returns the number of rows between the first and last row that holds dark pixels"""
+    ink_rows = np.flatnonzero((gray < 128).any(axis=1))
+    if len(ink_rows) == 0:
+        return 0
+    return int(ink_rows[-1] - ink_rows[0] + 1)
+
+
+def scale_to_height(gray, target_height):
+    """Shrinks the array so that its text is about target_height pixels tall, arrays with smaller text are kept"""
+    height = text_height(gray)
+    if target_height <= 0 or height <= target_height:
+        return gray
+    scale = target_height / height
+    size = (max(math.floor(gray.shape[1] * scale), 1), max(math.floor(gray.shape[0] * scale), 1))
+    return np.asarray(Image.fromarray(gray).resize(size, resample=Image.Resampling.BOX), dtype=np.uint8)
+
+
+def preprocess(image, preprocess_steps=steps, target_height=32):
+    """Runs the given steps on a crop and returns it as a grayscale image, ready for the OCR scan"""
+    gray = to_gray(image)
+    if 'otsu' in preprocess_steps:
+        gray = binarize(gray)
+    if 'deskew' in preprocess_steps:
+        gray = deskew(gray)
+    if 'scale' in preprocess_steps:
+        gray = scale_to_height(gray, target_height)
+    return Image.fromarray(gray)
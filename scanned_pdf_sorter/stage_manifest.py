@@ -0,0 +1,94 @@
+import os
+import json
+import hashlib
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+
+def file_hash(file_path):
+    """Returns the sha256 hash of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_hashes(pdf_path):
+    """Returns a list with a sha256 hash of the contents of each page of a pdf file
+
+    The hash covers everything that a page references, such as its content streams and scanned images, but not the
+    rest of the document, so replacing one page of a pdf only changes the hash of that page
+    """
+    reader = PdfReader(pdf_path)
+    hashes = []
+    for page in reader.pages:
+        digest = hashlib.sha256()
+        digest.update(repr([float(value) for value in page.mediabox]).encode())
+        _hash_object(page, digest, set())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _hash_object(obj, digest, seen):
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            digest.update(f"R{obj.idnum}".encode())
+            return
+        seen.add(obj.idnum)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        digest.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        for key in sorted(obj.keys()):
+            if key == '/Parent':
+                continue
+            digest.update(key.encode())
+            _hash_object(obj.raw_get(key), digest, seen)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            _hash_object(item, digest, seen)
+    else:
+        digest.update(repr(obj).encode())
+
+
+def stage_key(**inputs):
+    """Returns a hash of the inputs of a stage, used to tell if a stage's output for a page is out of date"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+class StageManifest:
+    """Records the inputs that were used to produce each page's output for every stage
+
+    The manifest is saved as json inside the output directory, where 'input' describes the input pdf file and 'pages'
+    maps each page name to the stage keys of the outputs that are currently saved for that page
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.data = {'input': {}, 'pages': {}}
+        if os.path.isfile(self.manifest_file):
+            try:
+                with open(self.manifest_file) as json_file:
+                    self.data = json.load(json_file)
+            except (OSError, ValueError):
+                print(f"-Unable to read {self.manifest_file}, every page will be processed")
+
+    def save(self):
+        with open(self.manifest_file, 'w') as json_file:
+            json.dump(self.data, json_file, indent=4)
+
+    def reset(self):
+        self.data = {'input': {}, 'pages': {}}
+
+    def get_key(self, page_name, stage):
+        return self.data['pages'].get(page_name, {}).get(stage)
+
+    def is_current(self, page_name, stage, key):
+        return self.get_key(page_name, stage) == key
+
+    def update(self, page_name, stage, key):
+        self.data['pages'].setdefault(page_name, {})[stage] = key
+
+    def remove_page(self, page_name):
+        self.data['pages'].pop(page_name, None)
@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import sqlite3
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from scanned_pdf_sorter.pdf_image_config import default_config_create
+from scanned_pdf_sorter.batch_cli import process_pdf
+
+
+def ignore_sigint():
+    """Pool initializer that leaves ctrl+c to the service, which lets the running files finish before it stops"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class WatchFolderService:
+    """Watches an inbox directory and sorts every pdf file that is dropped into it
+
+    A file is only queued once its size and modification time have stayed the same for settle_seconds, so files that
+    are still being written by a scanner are left alone. The queue is kept in a sqlite file, so a restart neither
+    loses queued files nor sorts finished files again. No more than max_queue files are queued at once, the rest are
+    left in the inbox until there is room.
+    """
+
+    def __init__(self, inbox, output_root, done_dir=None, failed_dir=None, config_file='config.ini', workers=2,
+                 max_queue=100, settle_seconds=5.0, poll_interval=2.0, queue_file=None, database=False):
+        self.inbox = os.path.abspath(inbox)
+        self.output_root = os.path.abspath(output_root)
+        self.done_dir = os.path.abspath(done_dir or os.path.join(self.inbox, 'done'))
+        self.failed_dir = os.path.abspath(failed_dir or os.path.join(self.inbox, 'failed'))
+        self.config_file = os.path.abspath(config_file)
+        self.workers = max(workers, 1)
+        # the cores are split between the files sorted at once, so the pools inside each job do not oversubscribe them
+        self.job_workers = max((os.cpu_count() or 1) // self.workers, 1)
+        self.overrides = {('SETTINGS', option): self.job_workers
+                          for option in ('ocr_workers', 'crop_workers', 'render_workers')}
+        self.max_queue = max(max_queue, 1)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.database = database
+        self.candidates = {}
+        self.running = {}
+        self.stopping = False
+        self.backpressure = False
+        # set when a worker process died, which breaks the whole pool, until a new pool is started
+        self.pool_broken = False
+        # number of times each file was running when the pool broke, a file that keeps breaking it is failed
+        self.pool_crashes = {}
+        self.max_pool_crashes = 3
+
+        for folder in (self.inbox, self.output_root, self.done_dir, self.failed_dir):
+            os.makedirs(folder, exist_ok=True)
+        default_config_create(self.config_file)
+
+        self.queue = sqlite3.connect(queue_file or os.path.join(self.output_root, 'watch_queue.db'))
+        self.queue.execute("CREATE TABLE IF NOT EXISTS jobs (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                           "state TEXT, output_dir TEXT, queued_at TEXT, finished_at TEXT, error TEXT)")
+        # files that were being sorted when the service last stopped are sorted again
+        requeued = self.queue.execute("UPDATE jobs SET state = 'queued' WHERE state = 'processing'").rowcount
+        self.queue.commit()
+        if requeued:
+            print(f"-Requeued {requeued} files that were interrupted")
+
+    def job_state(self, path):
+        row = self.queue.execute("SELECT state, size, mtime FROM jobs WHERE path = ?", (path,)).fetchone()
+        return row
+
+    def queued_count(self):
+        return self.queue.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'processing')").fetchone()[0]
+
+    def poll_inbox(self):
+        """Finds the pdf files in the inbox whose size and modification time have settled, and queues them"""
+        now = time.time()
+        seen = set()
+        for file in sorted(os.listdir(self.inbox)):
+            path = os.path.join(self.inbox, file)
+            if not (file.lower().endswith('.pdf') and os.path.isfile(path)):
+                continue
+            seen.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if path not in self.candidates or self.candidates[path][0] != signature:
+                self.candidates[path] = (signature, now)
+                continue
+            if now - self.candidates[path][1] < self.settle_seconds:
+                continue
+
+            row = self.job_state(path)
+            if row is not None and row[0] in ('queued', 'processing'):
+                continue
+            if row is not None and row[0] in ('done', 'failed') and (row[1], row[2]) == signature:
+                # the file was sorted, but the service stopped before it could be moved
+                self.move_original(path, row[0])
+                continue
+            if self.queued_count() >= self.max_queue:
+                if self.backpressure is False:
+                    print(f"-Queue is full ({self.max_queue} files), leaving new files in the inbox")
+                    self.backpressure = True
+                break
+            self.backpressure = False
+            queued_at = datetime.now()
+            output_dir = os.path.join(self.output_root,
+                                      f"{os.path.splitext(file)[0]}-{queued_at.strftime('%Y%m%d-%H%M%S')}")
+            self.queue.execute("INSERT OR REPLACE INTO jobs (path, size, mtime, state, output_dir, queued_at) "
+                               "VALUES (?, ?, ?, 'queued', ?, ?)",
+                               (path, signature[0], signature[1], output_dir, queued_at.isoformat()))
+            self.queue.commit()
+            del self.candidates[path]
+            print(f"-{file} queued")
+        for path in list(self.candidates):
+            if path not in seen:
+                del self.candidates[path]
+
+    def dispatch(self, executor):
+        """Hands queued files to the worker pool, keeping no more than one file per worker in flight"""
+        while len(self.running) < self.workers and self.stopping is False:
+            row = self.queue.execute("SELECT path, output_dir FROM jobs WHERE state = 'queued' "
+                                     "ORDER BY queued_at LIMIT 1").fetchone()
+            if row is None:
+                return
+            path, output_dir = row
+            if os.path.isfile(path) is False:
+                self.finish_job(path, 'failed', 'file was removed from the inbox')
+                continue
+            self.queue.execute("UPDATE jobs SET state = 'processing' WHERE path = ?", (path,))
+            self.queue.commit()
+            print(f"-Sorting {os.path.basename(path)}")
+            try:
+                self.running[path] = executor.submit(process_pdf, path, output_dir, self.config_file, self.overrides,
+                                                     False, self.database)
+            except BrokenProcessPool:
+                self.requeue_job(path)
+                self.pool_broken = True
+                return
+
+    def collect(self):
+        """Records the results of the files that finished sorting and moves their originals"""
+        for path, future in list(self.running.items()):
+            if future.done() is False:
+                continue
+            del self.running[path]
+            try:
+                summary = future.result()
+                state = 'done' if summary['status'] == 'ok' else 'failed'
+                error = summary['error']
+                print(f"-{os.path.basename(path)}: {summary['status']} "
+                      f"({summary['pages']} pages, {summary['groups']} groups, {summary['seconds']:.1f}s)")
+            except BrokenProcessPool:
+                # a worker process died, every file that was running is sorted again by a new pool
+                self.pool_broken = True
+                self.pool_crashes[path] = self.pool_crashes.get(path, 0) + 1
+                if self.pool_crashes[path] < self.max_pool_crashes:
+                    print(f"-{os.path.basename(path)}: a worker process died, requeued")
+                    self.requeue_job(path)
+                    continue
+                state = 'failed'
+                error = f"a worker process died {self.pool_crashes[path]} times while sorting this file"
+                print(f"-{os.path.basename(path)}: failed ({error})")
+            except Exception as e:
+                state = 'failed'
+                error = f"{type(e).__name__}: {e}"
+                print(f"-{os.path.basename(path)}: failed ({error})")
+            self.pool_crashes.pop(path, None)
+            self.finish_job(path, state, error)
+            self.move_original(path, state)
+
+    def requeue_job(self, path):
+        self.queue.execute("UPDATE jobs SET state = 'queued' WHERE path = ?", (path,))
+        self.queue.commit()
+
+    def finish_job(self, path, state, error=None):
+        self.queue.execute("UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE path = ?",
+                           (state, datetime.now().isoformat(), error, path))
+        self.queue.commit()
+
+    def move_original(self, path, state):
+        """Moves a sorted file out of the inbox into the done or failed folder"""
+        if os.path.isfile(path) is False:
+            return
+        target_dir = self.done_dir if state == 'done' else self.failed_dir
+        name, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(target_dir, f"{name}{ext}")
+        count = 1
+        while os.path.exists(target):
+            count += 1
+            target = os.path.join(target_dir, f"{name}-{count}{ext}")
+        shutil.move(path, target)
+
+    def stop(self, *args):
+        print("-Stopping watch folder, waiting for the running files to finish")
+        self.stopping = True
+
+    def start_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=ignore_sigint)
+
+    def run(self):
+        """Polls the inbox and sorts the files in it until the service is stopped"""
+        print(f"-Watching {self.inbox} with {self.workers} workers and {self.job_workers} cores per file")
+        executor = self.start_pool()
+        try:
+            while self.stopping is False or self.running:
+                if self.stopping is False:
+                    self.poll_inbox()
+                    if self.pool_broken is False:
+                        self.dispatch(executor)
+                self.collect()
+                if self.pool_broken and not self.running:
+                    print("-Worker pool broke, starting a new one")
+                    executor.shutdown(wait=True)
+                    executor = self.start_pool()
+                    self.pool_broken = False
+                time.sleep(self.poll_interval)
+        finally:
+            executor.shutdown(wait=True)
+        self.queue.close()
+        print("-Watch folder stopped")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pdf_sorter_watch',
+                                     description='Sorts every scanned pdf file that is dropped into an inbox folder')
+    parser.add_argument('inbox', help='folder that the scanners save pdf files into')
+    parser.add_argument('-o', '--output', default='pdf_sorter_watch', help='folder for the sorted output')
+    parser.add_argument('--done', default=None, help='folder for sorted originals (default: INBOX/done)')
+    parser.add_argument('--failed', default=None, help='folder for originals that failed (default: INBOX/failed)')
+    parser.add_argument('-c', '--config', default='config.ini', help='config file to use')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='number of pdf files sorted at once')
+    parser.add_argument('--max-queue', type=int, default=100, help='number of files that can be queued at once')
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help='seconds a file must stay unchanged before it is queued')
+    parser.add_argument('--poll', type=float, default=2.0, help='seconds between inbox scans')
+    parser.add_argument('--database', action='store_true', help='look up the customer emails in the database')
+    return parser
+
+
+def main(argv=None):
+    multiprocessing.freeze_support()
+    args = build_parser().parse_args(argv)
+    service = WatchFolderService(args.inbox, args.output, done_dir=args.done, failed_dir=args.failed,
+                                 config_file=args.config, workers=args.workers, max_queue=args.max_queue,
+                                 settle_seconds=args.settle, poll_interval=args.poll, database=args.database)
+    signal.signal(signal.SIGINT, service.stop)
+    signal.signal(signal.SIGTERM, service.stop)
+    service.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
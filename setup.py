@@ -31,8 +31,13 @@ setup(
         'pdf2image',
         'pytesseract',
         'pyodbc',
+        'pypdf',
+        'numpy',
     ],
     extras_require={
+        'tesserocr': [
+            'tesserocr',
+        ],
         'dev': [
             'wheel',
             'pyinstaller',
@@ -42,7 +47,10 @@ setup(
     },
     zip_safe=False,
     entry_points={'console_scripts': [
-        'pdf_sorter_app_run = scanned_pdf_sorter.pdf_sorter_gui:main'
+        'pdf_sorter_app_run = scanned_pdf_sorter.pdf_sorter_gui:main',
+        'pdf_sorter_batch = scanned_pdf_sorter.batch_cli:main',
+        'pdf_sorter_watch = scanned_pdf_sorter.watch_folder:main',
+        'pdf_sorter_bench = scanned_pdf_sorter.benchmark:main',
     ]},
     classifiers=[
         "Development Status :: 3 - Alpha",
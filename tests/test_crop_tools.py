@@ -0,0 +1,83 @@
+import random
+
+import pytest
+from PIL import Image
+
+from scanned_pdf_sorter import crop_tools
+
+WIDTH, HEIGHT = 120, 300
+
+# (file name, image mode, save options) of every format that open_region reads a part of, or falls back on
+FORMATS = [
+    ('page.png', 'RGB', {}),
+    ('page_gray.png', 'L', {}),
+    ('page_mono.png', '1', {}),
+    ('page.ppm', 'RGB', {}),
+    ('page.pgm', 'L', {}),
+    ('page.pbm', '1', {}),
+    ('page.bmp', 'RGB', {}),
+    ('page_gray.bmp', 'L', {}),
+    ('page.tif', 'L', {}),
+    ('page_rgb.tif', 'RGB', {}),
+    ('page_lzw.tif', 'L', {'compression': 'tiff_lzw'}),
+    ('page_packbits.tif', '1', {'compression': 'packbits'}),
+]
+
+BOXES = [
+    (10, 20, 100, 150),  # inside the image
+    (0, 0, WIDTH, HEIGHT),  # the whole image
+    (-5, -5, 50, 50),  # past the top and left
+    (10, 250, 100, 350),  # past the bottom
+    (-20, 100, WIDTH + 20, 200),  # past the left and right
+    (10, HEIGHT + 10, 50, HEIGHT + 40),  # below the image
+]
+
+
+def make_image(mode):
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    data = random.Random(0).randbytes(WIDTH * HEIGHT * bands)
+    return Image.frombytes('L' if mode == '1' else mode, (WIDTH, HEIGHT), data).convert(mode)
+
+
+@pytest.mark.parametrize('box', BOXES)
+@pytest.mark.parametrize('file_name, mode, options', FORMATS)
+def test_open_region_matches_crop(tmp_path, file_name, mode, options, box):
+    image_file = tmp_path / file_name
+    make_image(mode).save(image_file, **options)
+    with Image.open(image_file) as image:
+        expected = image.crop(box)
+        expected.load()
+    region = crop_tools.open_region(image_file, box)
+    assert region.size == expected.size
+    assert region.mode == expected.mode
+    assert region.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('box', BOXES)
+def test_open_region_jpeg_size(tmp_path, box):
+    # jpeg files are decoded to grayscale, so only the size of the crop matches
+    image_file = tmp_path / 'page.jpg'
+    make_image('RGB').save(image_file, quality=90)
+    with Image.open(image_file) as image:
+        expected = image.crop(box)
+    region = crop_tools.open_region(image_file, box)
+    assert region.size == expected.size
+    assert region.mode == 'L'
+
+
+def test_crop_file_saves_crop(tmp_path):
+    image_file = tmp_path / 'page.png'
+    make_image('L').save(image_file)
+    crop_tools.crop_file(image_file, BOXES[0], tmp_path / 'crop.png')
+    with Image.open(tmp_path / 'crop.png') as crop:
+        assert crop.size == (90, 130)
+
+
+@pytest.mark.skipif(not crop_tools.pillow_partial_decode(), reason='partial decode is off for this Pillow version')
+@pytest.mark.parametrize('file_name, mode', [('page.ppm', 'RGB'), ('page.pgm', 'L'), ('page.png', 'L')])
+def test_partial_decode_is_used(tmp_path, file_name, mode):
+    image_file = tmp_path / file_name
+    make_image(mode).save(image_file)
+    with Image.open(image_file) as image:
+        assert crop_tools._decode_rows(image, BOXES[0]) is not None
+        assert image.size[1] < HEIGHT
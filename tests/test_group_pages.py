@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from scanned_pdf_sorter.pdf_sorter_tools import SorterTools
+
+
+def group_pages(ocr_results, images=None):
+    # group_pages only reads output_dir from the tools, so no config file or output folder is needed
+    return SorterTools.group_pages(SimpleNamespace(output_dir='/out'), ocr_results, images)
+
+
+def test_groups_pages_in_page_order():
+    groups = group_pages({3: '1175', 1: '1175', 2: '2000', 4: '1175'})
+    assert list(groups) == ['1175', '2000']
+    assert groups['1175']['pages'] == [1, 3, 4]
+    assert groups['2000']['pages'] == [2]
+
+
+def test_group_shape():
+    groups = group_pages({1: '1175'}, {1: 'page-1.png'})
+    assert groups == {'1175': {'images': ['/out/images/page-1.png'], 'pages': [1], 'email': None,
+                               'pdf': '/out/pdfs/pdf-1175.pdf'}}
+
+
+def test_pages_without_images_keep_an_empty_list():
+    groups = group_pages({1: '1175', 2: '1175'}, {2: 'page-2.png'})
+    assert groups['1175']['images'] == ['/out/images/page-2.png']
+    assert group_pages({1: '0'})['0']['images'] == []
+
+
+def test_no_pages():
+    assert group_pages({}) == {}
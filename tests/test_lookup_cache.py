@@ -0,0 +1,66 @@
+from scanned_pdf_sorter import lookup_cache
+from scanned_pdf_sorter.lookup_cache import LookupCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_hits_and_misses():
+    cache = LookupCache(max_size=4, ttl=60)
+    assert cache.get(1175) == (False, None)
+    cache.set(1175, 'a@example.com')
+    assert cache.get('1175') == (True, 'a@example.com')
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_none_is_not_cached():
+    cache = LookupCache()
+    cache.set(1175, None)
+    assert cache.get(1175) == (False, None)
+
+
+def test_expired_entries_are_kept_for_stale_reads(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(lookup_cache.time, 'time', clock.time)
+    cache = LookupCache(ttl=60)
+    cache.set(1175, 'a@example.com')
+    clock.now += 59
+    assert cache.get(1175) == (True, 'a@example.com')
+    clock.now += 2
+    assert cache.get(1175) == (False, None)
+    assert cache.get_stale(1175) == (True, 'a@example.com')
+    assert cache.get_stale(2000) == (False, None)
+    assert cache.stats()['stale_hits'] == 1
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = LookupCache(max_size=2)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert cache.get(2) == (False, None)
+    assert cache.get(1) == (True, 'a')
+    assert cache.get(3) == (True, 'c')
+
+
+def test_entries_survive_in_the_db_file(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(lookup_cache.time, 'time', clock.time)
+    db_file = str(tmp_path / 'cache.db')
+    cache = LookupCache(ttl=60, db_file=db_file)
+    cache.set(1175, 'a@example.com')
+    cache.close()
+
+    cache = LookupCache(ttl=60, db_file=db_file)
+    assert cache.get(1175) == (True, 'a@example.com')
+    # the time it was stored is kept too, so a restart does not renew an entry
+    clock.now += 61
+    assert cache.get(1175) == (False, None)
+    assert cache.get_stale(1175) == (True, 'a@example.com')
+    cache.close()
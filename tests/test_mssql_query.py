@@ -0,0 +1,55 @@
+from scanned_pdf_sorter.mssql_query import MsSqlQuery
+
+
+class FakeCursor:
+    """Cursor that answers IN (...) queries from a dict of customer number to email"""
+
+    def __init__(self, emails):
+        self.emails = emails
+        self.calls = []
+        self.rows = []
+
+    def execute(self, statement, *params):
+        self.calls.append((statement, params))
+        self.rows = [(num, self.emails[num]) for num in sorted(set(params)) if num in self.emails]
+
+    def fetchall(self):
+        return self.rows
+
+
+def make_query(tmp_path, emails, max_parameters=None):
+    query = MsSqlQuery(config_file=str(tmp_path / 'missing.ini'))
+    query.table_name, query.filter_column, query.query_column = 'customers', 'id', 'email'
+    query.cursor = FakeCursor(emails)
+    if max_parameters is not None:
+        query.max_parameters = max_parameters
+    return query
+
+
+def test_maps_every_number_to_its_email(tmp_path):
+    query = make_query(tmp_path, {1175: 'a@example.com', 1176: 'b@example.com'})
+    assert query.database_query_many(['1175', '1176', '0999', 'abc']) == {
+        '1175': 'a@example.com', '1176': 'b@example.com', '0999': None, 'abc': None}
+
+
+def test_numbers_with_the_same_value_share_a_lookup(tmp_path):
+    query = make_query(tmp_path, {12: 'a@example.com'})
+    assert query.database_query_many(['12', '0012']) == {'12': 'a@example.com', '0012': 'a@example.com'}
+    assert query.cursor.calls[0][1] == (12,)
+
+
+def test_chunks_are_padded_to_a_power_of_two(tmp_path):
+    query = make_query(tmp_path, {}, max_parameters=8)
+    query.database_query_many([str(num) for num in range(1, 12)])
+    params = [call[1] for call in query.cursor.calls]
+    assert [len(chunk) for chunk in params] == [8, 4]
+    assert params[0] == tuple(range(1, 9))
+    # the padding repeats the last number of the chunk
+    assert params[1] == (9, 10, 11, 11)
+    assert all(call[0].count('?') == len(call[1]) for call in query.cursor.calls)
+
+
+def test_no_query_without_numbers(tmp_path):
+    query = make_query(tmp_path, {})
+    assert query.database_query_many(['abc']) == {'abc': None}
+    assert query.cursor.calls == []
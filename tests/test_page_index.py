@@ -0,0 +1,40 @@
+from scanned_pdf_sorter import page_index
+
+
+def test_page_label_keeps_zero_padding():
+    assert page_index.page_label('c0ffee-0012.png') == '0012'
+    assert page_index.page_label('/out/crops/0012.png') == '0012'
+    assert page_index.page_label('0012.txt') == '0012'
+    assert page_index.page_label('notes.txt') is None
+
+
+def test_page_number():
+    assert page_index.page_number('page-0012.png') == 12
+    assert page_index.page_number('page-1000.ppm') == 1000
+    assert page_index.page_number('readme.md') is None
+
+
+def test_page_name_pads_like_pdftoppm():
+    assert page_index.page_name(7, 9) == '7'
+    assert page_index.page_name(7, 120) == '007'
+    assert page_index.page_name(1000, 1000) == '1000'
+
+
+def test_page_files_orders_past_999_pages(tmp_path):
+    names = [f"page-{page_index.page_name(num, 1200)}.png" for num in (1, 2, 10, 999, 1000, 1200)]
+    for name in reversed(names):
+        (tmp_path / name).touch()
+    assert list(page_index.page_files(tmp_path).values()) == names
+    assert list(page_index.page_files(tmp_path)) == [1, 2, 10, 999, 1000, 1200]
+
+
+def test_page_files_mixed_zero_padding(tmp_path):
+    # files of an earlier run of a shorter pdf are padded to fewer digits
+    for name in ('page-99.png', 'page-0100.png', 'page-003.png', '1000.txt', 'notes.txt'):
+        (tmp_path / name).touch()
+    assert page_index.page_files(tmp_path) == {3: 'page-003.png', 99: 'page-99.png', 100: 'page-0100.png',
+                                               1000: '1000.txt'}
+
+
+def test_page_files_missing_folder(tmp_path):
+    assert page_index.page_files(tmp_path / 'missing') == {}
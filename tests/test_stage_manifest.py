@@ -0,0 +1,57 @@
+from PIL import Image, ImageDraw
+
+from scanned_pdf_sorter import stage_manifest
+from scanned_pdf_sorter.stage_manifest import StageManifest, stage_key
+
+
+def make_pdf(pdf_path, texts):
+    pages = []
+    for text in texts:
+        page = Image.new('L', (200, 100), 255)
+        ImageDraw.Draw(page).text((10, 10), text, fill=0)
+        pages.append(page)
+    pages[0].save(pdf_path, resolution=72, save_all=True, append_images=pages[1:])
+
+
+def test_stage_key_depends_on_every_input():
+    key = stage_key(render='abc', crop=(1, 2, 3, 4))
+    assert key == stage_key(crop=(1, 2, 3, 4), render='abc')
+    assert key != stage_key(render='abc', crop=(1, 2, 3, 5))
+    assert key != stage_key(render='abd', crop=(1, 2, 3, 4))
+    assert key != stage_key(render='abc')
+
+
+def test_manifest_round_trip(tmp_path):
+    manifest_file = str(tmp_path / 'manifest.json')
+    manifest = StageManifest(manifest_file)
+    manifest.update('001', 'render', 'r1')
+    manifest.update('001', 'crop', 'c1')
+    manifest.update('002', 'render', 'r2')
+    manifest.data['input'] = {'hash': 'h'}
+    manifest.save()
+
+    manifest = StageManifest(manifest_file)
+    assert manifest.is_current('001', 'render', 'r1')
+    assert manifest.is_current('001', 'crop', 'c1')
+    assert not manifest.is_current('001', 'crop', 'c2')
+    assert manifest.get_key('003', 'render') is None
+    assert manifest.data['input'] == {'hash': 'h'}
+    manifest.remove_page('001')
+    assert manifest.get_key('001', 'render') is None
+    assert manifest.is_current('002', 'render', 'r2')
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    manifest_file = tmp_path / 'manifest.json'
+    manifest_file.write_text('{not json')
+    assert StageManifest(str(manifest_file)).data == {'input': {}, 'pages': {}}
+
+
+def test_page_hashes_only_change_for_the_changed_page(tmp_path):
+    make_pdf(tmp_path / 'a.pdf', ['1175', '2000', '3000'])
+    make_pdf(tmp_path / 'b.pdf', ['1175', '2001', '3000'])
+    hashes_a = stage_manifest.page_hashes(tmp_path / 'a.pdf')
+    hashes_b = stage_manifest.page_hashes(tmp_path / 'b.pdf')
+    assert len(hashes_a) == 3
+    assert [a == b for a, b in zip(hashes_a, hashes_b)] == [True, False, True]
+    assert stage_manifest.file_hash(tmp_path / 'a.pdf') != stage_manifest.file_hash(tmp_path / 'b.pdf')